@@ -0,0 +1,76 @@
+# Append-only activity log of the proctoring session, written as JSON Lines.
+# Only state changes are written, they are buffered in memory for a few seconds at most and the file is
+# rotated when it grows too large, so memory use stays flat and a crash loses at most one buffer.
+
+import json
+import os
+import threading
+import time
+
+
+class ActivityLog:
+
+    def __init__(self, path='activity.jsonl', flushInterval=5.0, bufferSize=100, maxBytes=5 * 1024 * 1024, backupCount=3):
+        self.path = path
+
+        #Buffered lines are written when bufferSize lines are waiting or after flushInterval seconds
+        self.flushInterval = flushInterval
+        self.bufferSize = bufferSize
+
+        #Size after which the file is rotated to path.1, path.2, ... keeping backupCount old files
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+
+        self.buffer = []
+        self.lastState = None
+        self.lastFlush = time.monotonic()
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def record(self, timestamp, state):
+        """
+        Input: Time of the frame and the dict of the detectors' verdicts for this frame
+        Output: Returns True if the state changed and was logged
+        """
+        with self.lock:
+            changed = state != self.lastState
+            if changed:
+                self.lastState = state
+                self.buffer.append(json.dumps(dict(time=timestamp, **state), default=str))
+
+            if len(self.buffer) >= self.bufferSize or time.monotonic() - self.lastFlush >= self.flushInterval:
+                self._flush()
+        return changed
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.file.close()
+
+    def _flush(self):
+        self.lastFlush = time.monotonic()
+        if not self.buffer or self.file.closed:
+            return
+
+        self.file.write('\n'.join(self.buffer) + '\n')
+        self.file.flush()
+        self.buffer = []
+
+        if self.file.tell() >= self.maxBytes:
+            self._rotate()
+
+    def _rotate(self):
+        self.file.close()
+        for index in range(self.backupCount - 1, 0, -1):
+            source = f'{self.path}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.path}.{index + 1}')
+        if self.backupCount > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
@@ -0,0 +1,65 @@
+# Non-blocking alerts for the proctoring loop.
+# The loop only queues an alert, the beep (which blocks for a full second) is played by a separate thread.
+
+import queue
+import threading
+import time
+
+try:
+    import winsound
+except ImportError:
+    #winsound only exists on Windows, the alert is then only printed
+    winsound = None
+
+#For Beeping
+frequency = 2500
+duration = 1000
+
+
+class AlertDispatcher(threading.Thread):
+
+    def __init__(self, cooldown=5.0, minInterval=1.0, maxQueued=10):
+        super().__init__(daemon=True)
+
+        #Seconds before the same kind of alert can be raised again
+        self.cooldown = cooldown
+
+        #Minimum seconds between two beeps, whatever their kind
+        self.minInterval = minInterval
+
+        self.alerts = queue.Queue(maxsize=maxQueued)
+        self.lastAlert = {}
+
+    def alert(self, kind, message):
+        """
+        Input: Kind of the alert (used for the cooldown) and the message to show
+        Output: Returns True if the alert was queued, False if it was dropped by the cooldown or a full queue
+        Never blocks the caller.
+        """
+        now = time.monotonic()
+        if now - self.lastAlert.get(kind, -self.cooldown) < self.cooldown:
+            return False
+
+        try:
+            self.alerts.put_nowait(message)
+        except queue.Full:
+            return False
+
+        self.lastAlert[kind] = now
+        return True
+
+    def run(self):
+        lastBeep = -self.minInterval
+
+        while True:
+            message = self.alerts.get()
+
+            #Rate limit the beeps
+            wait = self.minInterval - (time.monotonic() - lastBeep)
+            if wait > 0:
+                time.sleep(wait)
+
+            print("Alert:", message)
+            if winsound is not None:
+                winsound.Beep(frequency, duration)
+            lastBeep = time.monotonic()
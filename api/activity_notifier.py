@@ -0,0 +1,65 @@
+import asyncio
+import os
+
+from logger import log
+from socket_server import socket
+
+# Suspicious activities are sent to each admin at most once per NOTIFY_INTERVAL seconds
+NOTIFY_INTERVAL = float(os.environ.get("NOTIFY_INTERVAL", 0.25))
+
+
+class ActivityNotifier:
+    """Batches the suspicious activity events sent to the admins.
+
+    Events are queued per subscriber and sent every `interval` seconds as a
+    single `suspicious_activities` list, so an admin watching a whole exam
+    gets one emit per interval instead of one per event. Events of the same
+    interval are coalesced: a close that follows its open in the same batch
+    only fills in the end of the open.
+    """
+
+    def __init__(self, interval=NOTIFY_INTERVAL):
+        self.interval = interval
+        # admin socket id -> {(student id, activity, start): event}
+        self.pending = {}
+        self.sent = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def publish(self, sids, student_id, activity_data):
+        """Queue an interval open or close event for every subscriber, never waits"""
+        key = (student_id, activity_data["activity"], activity_data["timestamp"])
+        event = {"studentId": student_id, **activity_data}
+        for sid in sids:
+            events = self.pending.setdefault(sid, {})
+            previous = events.get(key)
+            if previous is not None and previous["state"] == "open":
+                # The admin has not seen the open yet, send it with its end
+                events[key] = {**event, "state": "open"}
+            else:
+                events[key] = event
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            pending, self.pending = self.pending, {}
+            for sid, events in pending.items():
+                try:
+                    await socket.emit("suspicious_activities", list(events.values()), to=sid)
+                    self.sent += len(events)
+                except Exception as e:
+                    log.error(f"Error sending suspicious activities to admin {sid}: {e}")
+
+
+async def start_activity_notifier(app):
+    app["activity_notifier"] = ActivityNotifier()
+    app["activity_notifier"].start()
+
+async def stop_activity_notifier(app):
+    app["activity_notifier"].stop()
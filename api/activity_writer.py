@@ -0,0 +1,374 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import psycopg
+
+from logger import log
+
+# Write-behind settings: a batch is written when FLUSH_SIZE rows are waiting or after FLUSH_INTERVAL seconds
+FLUSH_SIZE = int(os.environ.get("ACTIVITY_FLUSH_SIZE", 500))
+FLUSH_INTERVAL = float(os.environ.get("ACTIVITY_FLUSH_INTERVAL", 1.0))
+# Rows waiting in memory; beyond that they go straight to the fallback file
+MAX_QUEUE_SIZE = int(os.environ.get("ACTIVITY_MAX_QUEUE_SIZE", 10000))
+# Rows that could not be written to the database, replayed every REPLAY_INTERVAL seconds
+FALLBACK_PATH = os.environ.get(
+    "ACTIVITY_FALLBACK_PATH", os.path.join(os.path.dirname(__file__), "pending_activities.jsonl")
+)
+REPLAY_INTERVAL = float(os.environ.get("ACTIVITY_REPLAY_INTERVAL", 5.0))
+# The fallback file is renamed to this before being replayed, new rows go to a fresh FALLBACK_PATH
+CLAIMED_PATH = FALLBACK_PATH + ".replaying"
+# Rows the database rejected MAX_REPLAY_ATTEMPTS times are moved here instead of blocking the replay
+QUARANTINE_PATH = os.environ.get("ACTIVITY_QUARANTINE_PATH", FALLBACK_PATH + ".rejected")
+MAX_REPLAY_ATTEMPTS = 3
+
+# Width of the buckets of the per-student activity histogram, must divide an hour
+HISTOGRAM_BUCKET_MINUTES = 5
+
+INSERT_COLUMNS = "user_id, activity, timestamp, confidence"
+# The summary tables are kept up to date in the same transaction as the raw rows
+SUMMARY_OPEN_QUERY = (
+    "INSERT INTO user_activity_summary (user_id, activity, count, last_seen) VALUES (%s, %s, %s, %s) "
+    "ON CONFLICT (user_id, activity) DO UPDATE SET count = user_activity_summary.count + EXCLUDED.count, "
+    "last_seen = GREATEST(user_activity_summary.last_seen, EXCLUDED.last_seen)"
+)
+SUMMARY_CLOSE_QUERY = (
+    "INSERT INTO user_activity_summary (user_id, activity, total_seconds) VALUES (%s, %s, %s) "
+    "ON CONFLICT (user_id, activity) DO UPDATE SET "
+    "total_seconds = user_activity_summary.total_seconds + EXCLUDED.total_seconds"
+)
+HISTOGRAM_QUERY = (
+    "INSERT INTO user_activity_histogram (user_id, activity, bucket, count) VALUES (%s, %s, %s, %s) "
+    "ON CONFLICT (user_id, activity, bucket) DO UPDATE SET count = user_activity_histogram.count + EXCLUDED.count"
+)
+# Row ids of the interval opens are taken from the sequence before the COPY, closes update their open by id
+ALLOCATE_IDS_QUERY = (
+    "SELECT nextval(pg_get_serial_sequence('user_suspicious_activities', 'id')) FROM generate_series(1, %s)"
+)
+UPDATE_QUERY = "UPDATE user_suspicious_activities SET ended_at = %s, confidence = %s WHERE id = %s"
+# Closes whose open was written before a restart, matched on the interval start
+UPDATE_BY_START_QUERY = (
+    "UPDATE user_suspicious_activities SET ended_at = %s, confidence = %s "
+    "WHERE user_id = %s AND activity = %s AND timestamp = %s AND ended_at IS NULL"
+)
+
+
+class ActivityWriter:
+    """Write-behind persistence of the suspicious activity intervals of all tracks.
+
+    Tracks only queue rows; a background task writes them in bulk (COPY for
+    interval opens, executemany for closes). When the queue is full or the
+    database is unavailable the rows are appended to FALLBACK_PATH, so frame
+    processing never waits on Postgres and no row is lost. While rows wait in
+    the fallback file new rows are appended after them, so an interval's open
+    is always written before its close. Rows are marked as soon as their
+    transaction commits, so a write cancelled or failing after the commit
+    never sends them to the fallback file to be inserted twice. The file is
+    only touched from one dedicated thread, never from the event loop, and
+    synced to disk after every write.
+    """
+
+    def __init__(self, pool, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, max_queue_size=MAX_QUEUE_SIZE):
+        self.pool = pool
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.spilled = 0
+        # interval key -> row id of the intervals opened and not closed yet
+        self.row_ids = {}
+        # True while rows wait in the fallback files
+        self.backlog = os.path.exists(FALLBACK_PATH) or os.path.exists(CLAIMED_PATH)
+        self._next_replay = 0.0
+        # A single thread, so appends, claims and rewrites of the fallback files happen in order
+        self._files = ThreadPoolExecutor(max_workers=1, thread_name_prefix="activity-fallback")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+        # Write whatever is still queued
+        rows = []
+        while not self.queue.empty():
+            rows.append(self.queue.get_nowait())
+        if rows:
+            await self._flush(rows)
+        self._files.shutdown(wait=True)
+
+    def add(self, user_id, event):
+        """Queue an interval open or close event, never waits"""
+        try:
+            # The id comes from the socket payload, a row that can never be inserted is not queued
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            log.error(f"Dropping suspicious activity {event['activity']} of invalid user id {user_id!r}")
+            return
+        row = {
+            "state": event["state"],
+            "key": event["key"],
+            "user_id": user_id,
+            "activity": event["activity"],
+            "start": event["start"],
+            "end": event["end"],
+            "confidence": event["confidence"],
+        }
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Backpressure: keep the row on disk rather than slowing down the media path
+            self._spill([row])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            except asyncio.CancelledError:
+                # Stopped in the middle of a write: only the rows not committed yet are kept,
+                # a replay of committed rows would insert them and count them in the summaries twice
+                rows = _uncommitted(batch)
+                if rows:
+                    self._spill(rows)
+                raise
+
+    async def _flush(self, rows):
+        if self.backlog and time.monotonic() >= self._next_replay:
+            await self._replay()
+        if self.backlog:
+            # Older rows are still waiting in the fallback file, these go after them
+            self._spill(rows)
+            return
+        try:
+            await self._write(rows)
+        except Exception as e:
+            # Rows committed before the error, e.g. while returning the connection, are not kept
+            rows = _uncommitted(rows)
+            if rows:
+                log.error(f"Error writing {len(rows)} suspicious activities, keeping them in {FALLBACK_PATH}: {e}")
+                self._spill(rows)
+
+    async def _replay(self):
+        """Write the rows of the fallback files, in their own transactions"""
+        loop = asyncio.get_running_loop()
+        self._next_replay = time.monotonic() + REPLAY_INTERVAL
+        while True:
+            # Rows spilled from now on set the backlog again
+            self.backlog = False
+            rows = await loop.run_in_executor(self._files, _claim_fallback)
+            if not rows:
+                return
+            try:
+                remaining, rejected = await self._replay_rows(rows)
+            except asyncio.CancelledError:
+                # Stopped during the replay, the claimed file keeps the rows not committed yet
+                self.backlog = True
+                self._files.submit(_finish_replay, _uncommitted(rows), [])
+                raise
+            await loop.run_in_executor(self._files, _finish_replay, remaining, rejected)
+            if rejected:
+                log.error(f"Moved {len(rejected)} suspicious activities rejected by the database to {QUARANTINE_PATH}")
+            if remaining:
+                self.backlog = True
+                return
+            log.info(f"Replayed {len(rows) - len(rejected)} suspicious activities from {FALLBACK_PATH}")
+
+    async def _replay_rows(self, rows):
+        """Returns the rows to replay again later and the rows to quarantine"""
+        try:
+            await self._write(rows)
+            return [], []
+        except psycopg.OperationalError as e:
+            rows = _uncommitted(rows)
+            log.error(f"Database unavailable, {len(rows)} suspicious activities wait in {CLAIMED_PATH}: {e}")
+            return rows, []
+        except Exception as e:
+            rows = _uncommitted(rows)
+            log.warning(f"Replaying {len(rows)} suspicious activities one at a time: {e}")
+
+        # Find the rows the database rejects so they do not hold back the others
+        remaining, rejected = [], []
+        for index, row in enumerate(rows):
+            try:
+                await self._write([row])
+            except psycopg.OperationalError:
+                return remaining + _uncommitted(rows[index:]), rejected
+            except Exception as e:
+                if row.get("committed"):
+                    continue
+                row["attempts"] = row.get("attempts", 0) + 1
+                if row["attempts"] >= MAX_REPLAY_ATTEMPTS:
+                    log.error(f"Suspicious activity rejected {row['attempts']} times: {e}")
+                    rejected.append(row)
+                else:
+                    remaining.append(row)
+        return remaining, rejected
+
+    async def _write(self, rows):
+        opens = [row for row in rows if row["state"] == "open"]
+        closes = [row for row in rows if row["state"] == "close"]
+        row_ids = {}
+        async with self.pool.connection() as conn, conn.cursor() as cur:
+            if opens:
+                await cur.execute(ALLOCATE_IDS_QUERY, (len(opens),))
+                allocated = [row_id for row_id, in await cur.fetchall()]
+                async with cur.copy(f"COPY user_suspicious_activities (id, {INSERT_COLUMNS}) FROM STDIN") as copy:
+                    for row, row_id in zip(opens, allocated):
+                        await copy.write_row((row_id, row["user_id"], row["activity"], row["start"], row["confidence"]))
+                        # Rows spilled before intervals had a key can only be closed by their start
+                        if row.get("key"):
+                            row_ids[row["key"]] = row_id
+            if closes:
+                by_id, by_start = [], []
+                for row in closes:
+                    key = row.get("key")
+                    row_id = (row_ids.get(key) or self.row_ids.get(key)) if key else None
+                    if row_id is not None:
+                        by_id.append((row["end"], row["confidence"], row_id))
+                    else:
+                        by_start.append((row["end"], row["confidence"], row["user_id"], row["activity"], row["start"]))
+                if by_id:
+                    await cur.executemany(UPDATE_QUERY, by_id)
+                if by_start:
+                    log.warning(f"Closing {len(by_start)} suspicious activities opened before a restart by their start")
+                    await cur.executemany(UPDATE_BY_START_QUERY, by_start)
+            await self._update_summaries(cur, opens, closes)
+            await conn.commit()
+            # Set before anything else can be cancelled, e.g. returning the connection to the pool
+            for row in rows:
+                row["committed"] = True
+        # Only once committed: the opens can now be closed by id, the closed ones are forgotten
+        self.row_ids.update(row_ids)
+        for row in closes:
+            self.row_ids.pop(row.get("key"), None)
+
+    async def _update_summaries(self, cur, opens, closes):
+        # Aggregate the batch first so each summary row is written once per flush
+        counts = Counter()
+        last_seen = {}
+        buckets = Counter()
+        for row in opens:
+            key = (row["user_id"], row["activity"])
+            counts[key] += 1
+            last_seen[key] = max(last_seen.get(key, row["start"]), row["start"])
+            buckets[(*key, histogram_bucket(row["start"]))] += 1
+
+        durations = defaultdict(float)
+        for row in closes:
+            durations[(row["user_id"], row["activity"])] += (row["end"] - row["start"]).total_seconds()
+
+        if counts:
+            await cur.executemany(SUMMARY_OPEN_QUERY, [
+                (user_id, activity, count, last_seen[(user_id, activity)])
+                for (user_id, activity), count in counts.items()
+            ])
+            await cur.executemany(HISTOGRAM_QUERY, [
+                (user_id, activity, bucket, count) for (user_id, activity, bucket), count in buckets.items()
+            ])
+        if durations:
+            await cur.executemany(SUMMARY_CLOSE_QUERY, [
+                (user_id, activity, seconds) for (user_id, activity), seconds in durations.items()
+            ])
+
+    def _spill(self, rows):
+        self.spilled += len(rows)
+        if not self.backlog:
+            # Give the database some time before the first replay
+            self.backlog = True
+            self._next_replay = time.monotonic() + REPLAY_INTERVAL
+        self._files.submit(_append_rows, FALLBACK_PATH, rows)
+
+
+def _uncommitted(rows):
+    return [row for row in rows if not row.get("committed")]
+
+
+def _append_rows(path, rows, mode="a"):
+    created = mode == "w" or not os.path.exists(path)
+    with open(path, mode, encoding="utf-8") as file:
+        for row in rows:
+            file.write(json.dumps(row, default=datetime.isoformat) + "\n")
+        # The rows are only safe once on disk, the fallback file is what survives a crash during an outage
+        file.flush()
+        os.fsync(file.fileno())
+    if created:
+        # A new file is only durable once its directory entry is
+        _sync_directory(path)
+
+
+def _sync_directory(path):
+    """Make the creation, rename or removal of a file in the directory of path durable"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_rows(path):
+    rows = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            row = json.loads(line)
+            row["start"] = datetime.fromisoformat(row["start"])
+            if row["end"]:
+                row["end"] = datetime.fromisoformat(row["end"])
+            rows.append(row)
+    return rows
+
+
+def _claim_fallback():
+    """Rows to replay: the claimed file left by the previous replay, else the fallback file renamed"""
+    if not os.path.exists(CLAIMED_PATH):
+        if not os.path.exists(FALLBACK_PATH):
+            return []
+        # Rows spilled during the replay go to a new fallback file instead of being removed with this one
+        os.replace(FALLBACK_PATH, CLAIMED_PATH)
+        _sync_directory(CLAIMED_PATH)
+    return _read_rows(CLAIMED_PATH)
+
+
+def _finish_replay(remaining, rejected):
+    if rejected:
+        _append_rows(QUARANTINE_PATH, rejected)
+    if remaining:
+        _append_rows(CLAIMED_PATH + ".tmp", remaining, mode="w")
+        os.replace(CLAIMED_PATH + ".tmp", CLAIMED_PATH)
+    else:
+        os.remove(CLAIMED_PATH)
+    _sync_directory(CLAIMED_PATH)
+
+
+def histogram_bucket(timestamp):
+    """Start of the HISTOGRAM_BUCKET_MINUTES bucket containing timestamp"""
+    return timestamp - timedelta(
+        minutes=timestamp.minute % HISTOGRAM_BUCKET_MINUTES,
+        seconds=timestamp.second,
+        microseconds=timestamp.microsecond,
+    )
+
+
+async def start_activity_writer(app):
+    app["activity_writer"] = ActivityWriter(app["db"])
+    app["activity_writer"].start()
+
+async def stop_activity_writer(app):
+    await app["activity_writer"].stop()
@@ -0,0 +1,80 @@
+import os
+import time
+
+# Analysis rate settings, in analysed frames per second for each student stream
+ANALYSIS_RATE = float(os.environ.get("ANALYSIS_RATE", 2.0))
+ANALYSIS_MIN_RATE = float(os.environ.get("ANALYSIS_MIN_RATE", 0.5))
+ANALYSIS_BOOST_RATE = float(os.environ.get("ANALYSIS_BOOST_RATE", 5.0))
+# How long the boosted rate lasts after a suspicious event
+BOOST_SECONDS = 5.0
+# Load average per core above which every stream is slowed down
+HIGH_CPU_LOAD = 0.85
+# How often the load average is sampled
+LOAD_SAMPLE_SECONDS = 1.0
+
+# Current analysis rate of every stream, keyed by "<socket_id>:<track id>" since a socket can carry several tracks
+rates = {}
+
+_cpu_count = os.cpu_count() or 1
+_load = {"value": 0.0, "sampled_at": 0.0}
+
+
+def cpu_load(now):
+    """Load average per core, sampled at most once per LOAD_SAMPLE_SECONDS"""
+    if now - _load["sampled_at"] >= LOAD_SAMPLE_SECONDS:
+        try:
+            _load["value"] = os.getloadavg()[0] / _cpu_count
+        except (AttributeError, OSError):
+            # getloadavg is not available on Windows, only the executor queue is used there
+            _load["value"] = 0.0
+        _load["sampled_at"] = now
+    return _load["value"]
+
+
+class AnalysisScheduler:
+    """Decides which frames of one student stream get analysed.
+
+    The rate is driven by wall-clock time rather than the browser's frame
+    rate: every stream gets `target_rate` analyses per second, lowered when
+    the CPU or the inference executor queue is overloaded, and raised for
+    BOOST_SECONDS after a suspicious event.
+    """
+
+    def __init__(self, socket_id, track_id, executor, target_rate=ANALYSIS_RATE):
+        self.socket_id = socket_id
+        self.key = f"{socket_id}:{track_id}"
+        self.executor = executor
+        self.target_rate = target_rate
+        self.next_due = 0.0
+        self.boost_until = 0.0
+        rates[self.key] = target_rate
+
+    def current_rate(self, now):
+        rate = ANALYSIS_BOOST_RATE if now < self.boost_until else self.target_rate
+        pressure = max(
+            cpu_load(now) / HIGH_CPU_LOAD,
+            self.executor.queue_depth / self.executor.max_workers,
+        )
+        if pressure > 1:
+            rate = max(ANALYSIS_MIN_RATE, rate / pressure)
+        return rate
+
+    def should_analyse(self):
+        """True when the stream is due for an analysis, call it only when ready to analyse"""
+        now = time.monotonic()
+        rate = self.current_rate(now)
+        rates[self.key] = rate
+        if now < self.next_due:
+            return False
+        self.next_due = now + 1.0 / rate
+        return True
+
+    def boost(self):
+        """Analyse this stream faster for a while, e.g. after a suspicious event"""
+        now = time.monotonic()
+        self.boost_until = now + BOOST_SECONDS
+        # Make the next frame due right away
+        self.next_due = min(self.next_due, now)
+
+    def close(self):
+        rates.pop(self.key, None)
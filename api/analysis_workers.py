@@ -0,0 +1,295 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from logger import log
+
+# Number of analysis processes, one core is left to the signalling and media process;
+# 0 runs the face analysis on the in-process inference threads, which stalls the event loop during dlib scans
+ANALYSIS_PROCESSES = int(os.environ.get("ANALYSIS_PROCESSES", max(1, (os.cpu_count() or 2) - 1)))
+# Frames each process can hold at once, and the size of one frame slot in shared memory
+SLOTS_PER_PROCESS = int(os.environ.get("ANALYSIS_SLOTS_PER_PROCESS", 2))
+SLOT_BYTES = int(os.environ.get("ANALYSIS_SLOT_BYTES", 1920 * 1080 * 3))
+
+
+def shard(student_id, count):
+    """Index of the process that analyses a student, stable across restarts"""
+    return zlib.crc32(str(student_id).encode("utf-8")) % count
+
+
+def _worker_main(conn, shm_name, slot_bytes):
+    """Entry point of an analysis process: one FaceTracker per student of its shard"""
+    from ml_models import FaceTracker, classify_frame
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    trackers = {}
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            if message[0] == "close":
+                trackers.pop(message[1], None)
+                continue
+
+            _, request_id, student_id, slot, shape, scale = message
+            # A view on the slot, the frame is not copied again
+            image = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            tracker = trackers.get(student_id)
+            if tracker is None:
+                tracker = trackers[student_id] = FaceTracker()
+            try:
+                conn.send((request_id, classify_frame(tracker, image, scale), None))
+            except Exception as e:
+                conn.send((request_id, None, str(e)))
+            finally:
+                del image
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+
+
+class AnalysisWorker:
+    """One analysis process, its shared-memory frame slots and its pipe.
+
+    Frame copies and pipe sends run on the worker's own I/O thread, in
+    order, so a frame-sized copy never blocks the event loop and a respawn
+    never swaps the shared memory under a copy.
+    """
+
+    def __init__(self, index, context, slots, slot_bytes):
+        self.index = index
+        self.context = context
+        self.slot_bytes = slot_bytes
+        self.shm_size = slots * slot_bytes
+        self.free_slots = list(range(slots))
+        self.slots = asyncio.Semaphore(slots)
+        self.waiting = 0
+        self.restarts = 0
+        self.io = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"analysis-io-{index}")
+        self._spawn()
+
+    def _spawn(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=self.shm_size)
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, self.shm.name, self.slot_bytes),
+            name=f"analysis-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def _release_process(self):
+        with suppress(OSError):
+            self.conn.close()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.shm.close()
+        with suppress(FileNotFoundError):
+            self.shm.unlink()
+
+    def respawn(self):
+        """Replace a dead process, runs on the I/O thread"""
+        self._release_process()
+        self._spawn()
+        self.restarts += 1
+
+    def send(self, message):
+        # Runs on the I/O thread, the results are received by the pool's reader thread
+        self.conn.send(message)
+
+    def submit_frame(self, slot, image, message):
+        """Copy the frame into its slot and hand it to the process, runs on the I/O thread"""
+        view = np.ndarray(image.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, image)
+        del view
+        self.conn.send(message)
+
+    def stop(self):
+        self.io.shutdown(wait=True)
+        with suppress(BrokenPipeError, OSError):
+            self.send(None)
+        self._release_process()
+
+
+class AnalysisWorkerPool:
+    """Face analysis in separate processes, sharded by student.
+
+    The signalling and media process decodes the frames and copies them into
+    a shared-memory slot of the process that owns the student; only the slot
+    index goes through the pipe, and the activity comes back the same way.
+    Each student always lands on the same process, so its FaceTracker state
+    stays there and the analysis uses one core per process instead of
+    sharing the GIL of the front end. A process that dies fails its pending
+    frames, gives their slots back and is started again.
+    """
+
+    def __init__(self, processes=ANALYSIS_PROCESSES, slots=SLOTS_PER_PROCESS, slot_bytes=SLOT_BYTES):
+        self.slot_bytes = slot_bytes
+        self.max_workers = processes
+        self.in_flight = 0
+        self.loop = asyncio.get_running_loop()
+        # request id -> (future, worker, slot) of the frames sent to a process
+        self.pending = {}
+        # student id -> number of live tracks, the tracking state is dropped with the last one
+        self.students = {}
+        self.closing = False
+        self._request_ids = itertools.count()
+        context = multiprocessing.get_context("spawn")
+        self.workers = [AnalysisWorker(index, context, slots, slot_bytes) for index in range(processes)]
+        for worker in self.workers:
+            self._start_reader(worker)
+
+    @property
+    def queue_depth(self):
+        """Number of frames waiting for a free slot"""
+        return sum(worker.waiting for worker in self.workers)
+
+    def _worker_for(self, student_id):
+        return self.workers[shard(student_id, len(self.workers))]
+
+    async def analyse(self, student_id, image, scale=1):
+        """Activity of one grayscale or BGR frame, analysed by the process that owns the student.
+
+        `scale` is the factor from the image to the full frame, when the image was decimated.
+        """
+        if image.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {image.nbytes} bytes does not fit in a {self.slot_bytes} bytes slot")
+        worker = self._worker_for(student_id)
+        self.in_flight += 1
+        try:
+            worker.waiting += 1
+            try:
+                await worker.slots.acquire()
+            finally:
+                worker.waiting -= 1
+            slot = worker.free_slots.pop()
+            request_id = next(self._request_ids)
+            future = self.loop.create_future()
+            # Registered before the send, the answer can come back before the send returns;
+            # the slot is released when the process answers or dies, even if this request is cancelled
+            self.pending[request_id] = (future, worker, slot)
+            message = ("analyse", request_id, student_id, slot, image.shape, scale)
+            try:
+                await self.loop.run_in_executor(worker.io, worker.submit_frame, slot, image, message)
+            except Exception:
+                self._forget(request_id)
+                raise
+            return await future
+        finally:
+            self.in_flight -= 1
+
+    def open_student(self, student_id):
+        """Count a new track of the student"""
+        self.students[student_id] = self.students.get(student_id, 0) + 1
+
+    def close_student(self, student_id):
+        """Drop the tracking state of a student once its last track ended"""
+        count = self.students.get(student_id, 0) - 1
+        if count > 0:
+            self.students[student_id] = count
+            return
+        self.students.pop(student_id, None)
+        worker = self._worker_for(student_id)
+        worker.io.submit(self._send_quietly, worker, ("close", student_id))
+
+    @staticmethod
+    def _send_quietly(worker, message):
+        try:
+            worker.send(message)
+        except (BrokenPipeError, OSError) as e:
+            log.error(f"Error sending {message[0]} to analysis process {worker.index}: {e}")
+
+    def _start_reader(self, worker):
+        threading.Thread(
+            target=self._read_results, args=(worker, worker.conn),
+            name=f"analysis-results-{worker.index}", daemon=True,
+        ).start()
+
+    def _read_results(self, worker, conn):
+        while True:
+            try:
+                request_id, activity, error = conn.recv()
+            except (EOFError, OSError):
+                with suppress(RuntimeError):
+                    self.loop.call_soon_threadsafe(self._fail_worker, worker)
+                return
+            try:
+                self.loop.call_soon_threadsafe(self._resolve, request_id, activity, error)
+            except RuntimeError:
+                # The event loop is closed, the server is shutting down
+                return
+
+    def _resolve(self, request_id, activity, error):
+        future = self._forget(request_id)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(activity)
+
+    def _forget(self, request_id):
+        """Release the slot of a request, returns its future unless it was already released"""
+        entry = self.pending.pop(request_id, None)
+        if entry is None:
+            return None
+        future, worker, slot = entry
+        worker.free_slots.append(slot)
+        worker.slots.release()
+        return future
+
+    def _fail_worker(self, worker):
+        if self.closing:
+            return
+        log.error(f"Analysis process {worker.index} exited, restarting it")
+        for request_id, (_, owner, _) in list(self.pending.items()):
+            if owner is worker:
+                future = self._forget(request_id)
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Analysis process {worker.index} exited"))
+        asyncio.ensure_future(self._respawn(worker))
+
+    async def _respawn(self, worker):
+        try:
+            # On the I/O thread, after any copy still running for the old process
+            await self.loop.run_in_executor(worker.io, worker.respawn)
+        except Exception as e:
+            log.error(f"Error restarting analysis process {worker.index}: {e}")
+            return
+        self._start_reader(worker)
+
+    def shutdown(self):
+        self.closing = True
+        for worker in self.workers:
+            worker.stop()
+
+
+async def start_analysis_workers(app):
+    if ANALYSIS_PROCESSES <= 0:
+        app["analysis_workers"] = None
+        return
+    try:
+        app["analysis_workers"] = AnalysisWorkerPool()
+    except Exception as e:
+        # e.g. no shared memory in the container, the inference threads take over
+        log.error(f"Error starting the analysis processes, analysing on the inference executor: {e}")
+        app["analysis_workers"] = None
+        return
+    log.info(f"Started {ANALYSIS_PROCESSES} analysis processes")
+
+async def stop_analysis_workers(app):
+    if app["analysis_workers"] is not None:
+        app["analysis_workers"].shutdown()
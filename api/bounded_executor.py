@@ -0,0 +1,36 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BoundedExecutor:
+    """Thread pool for blocking work, awaited from the event loop.
+
+    At most `max_pending` calls are submitted at once (running + queued),
+    further callers wait on a semaphore instead of piling up in the pool's
+    unbounded queue.
+    """
+
+    def __init__(self, max_workers, max_pending, thread_name_prefix):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = asyncio.Semaphore(max_pending)
+        self.in_flight = 0
+
+    @property
+    def queue_depth(self):
+        """Number of submitted calls waiting for a free worker"""
+        return max(0, self.in_flight - self.max_workers)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on a worker thread and wait for its result"""
+        self.in_flight += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,85 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from aiohttp import web
+
+# JSON bodies at least this large are gzip-compressed for clients that accept it
+GZIP_MIN_SIZE = 1024
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after `ttl` seconds.
+
+    A reader that may race with an invalidation takes `version(key)` before
+    reading the source and passes it to `set`: a value read before the
+    invalidation is then not stored.
+    """
+
+    def __init__(self, max_size=256, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Bumped by invalidate(): for every key at once, and per key
+        self._generation = 0
+        self._versions = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def version(self, key):
+        return (self._generation, self._versions.get(key, 0))
+
+    def set(self, key, value, ttl=None, version=None):
+        if version is not None and version != self.version(key):
+            # Invalidated since the value was read, it may already be stale
+            return
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when no key is given"""
+        if key is None:
+            self._entries.clear()
+            self._generation += 1
+            self._versions.clear()
+        else:
+            self._entries.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def make_etag(body):
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+
+def conditional_json_response(request, body, etag):
+    """JSON response honouring If-None-Match, gzip-compressed when large"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return web.Response(status=304, headers=headers)
+    response = web.Response(text=body, content_type="application/json", headers=headers)
+    if len(body) >= GZIP_MIN_SIZE:
+        # aiohttp only compresses when the request's Accept-Encoding allows it
+        response.enable_compression()
+    return response
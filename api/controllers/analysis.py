@@ -0,0 +1,25 @@
+from aiohttp import web
+from controllers.middlewares import validate_login
+import analysis_scheduler
+
+@validate_login
+async def find_rates(request):
+    inference = request.app["inference"]
+    stats = {
+        "rates": analysis_scheduler.rates,
+        "queue_depth": inference.queue_depth,
+        "in_flight": inference.in_flight,
+    }
+    workers = request.app["analysis_workers"]
+    if workers is not None:
+        # Frames waiting for each analysis process
+        stats["processes"] = [
+            {"index": worker.index, "alive": worker.process.is_alive(), "queue_depth": worker.waiting}
+            for worker in workers.workers
+        ]
+    return web.json_response(stats)
+
+
+routes = [
+    web.get("/analysis/rates", find_rates),
+]
@@ -1,7 +1,7 @@
 from aiohttp import web
 import jwt
-import bcrypt
 import psycopg
+from controllers.students import invalidate_students
 
 async def login(request):
     payload = await request.json()
@@ -14,33 +14,33 @@ async def login(request):
         return web.json_response({"message": "Invalid email or password"}, status=400)
 
     db = request.app["db"]
-    async with db.cursor(row_factory=psycopg.rows.dict_row) as cur:
+    # The connection goes back to the pool before the password check
+    async with db.connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
         await cur.execute(
             "SELECT first_name, last_name, email, password, role FROM users WHERE email = %s",
             (email,),
         )
         row = await cur.fetchone()
-        if row is None:
-            return web.json_response(
-                {"message": "Invalid email or password"}, status=401
-            )
-        is_correct_password = bcrypt.checkpw(
-            password.encode("utf-8"), row["password"].encode("utf-8")
+    if row is None:
+        return web.json_response(
+            {"message": "Invalid email or password"}, status=401
         )
-        if is_correct_password is False:
-            return web.json_response(
-                {"message": "Invalid email or password"}, status=401
-            )
-        user = {
-            "first_name": row["first_name"],
-            "last_name": row["last_name"],
-            "email": row["email"],
-            "role": row["role"],
-        }
-        token = jwt.encode(user, "1234", algorithm="HS256")
+    # bcrypt runs on the password hasher's threads, not on the event loop
+    is_correct_password = await request.app["password_hasher"].check(password, row["password"])
+    if is_correct_password is False:
         return web.json_response(
-            {"message": "Login successful", "token": token, "user": user}
+            {"message": "Invalid email or password"}, status=401
         )
+    user = {
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+        "email": row["email"],
+        "role": row["role"],
+    }
+    token = jwt.encode(user, "1234", algorithm="HS256")
+    return web.json_response(
+        {"message": "Login successful", "token": token, "user": user}
+    )
 
 
 async def register(request):
@@ -65,24 +65,27 @@ async def register(request):
             {"message": "Invalid email, first name, last name or password"}, status=400
         )
 
-    async with db.cursor(row_factory=psycopg.rows.dict_row) as cur:
+    async with db.connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
         await cur.execute("SELECT id FROM users WHERE email = %s", (email,))
         row = await cur.fetchone()
-        if row is not None:
-            return web.json_response({"message": "User already exists"}, status=400)
-        hashed_password = hash_password(password)
-        await cur.execute(
-            "INSERT INTO users (first_name, last_name, email, password) VALUES (%s, %s, %s, %s)",
-            (first_name, last_name, email, hashed_password),
-        )
-        await db.commit()
-    return web.json_response({"success": True}, status=201)
-
+    if row is not None:
+        return web.json_response({"message": "User already exists"}, status=400)
 
-def hash_password(plain_password: str) -> str:
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(plain_password.encode("utf-8"), salt)
-    return hashed.decode("utf-8")
+    # Hash without holding a pooled connection, bcrypt runs on the password hasher's threads
+    hashed_password = await request.app["password_hasher"].hash(password)
+    try:
+        async with db.connection() as conn, conn.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO users (first_name, last_name, email, password) VALUES (%s, %s, %s, %s)",
+                (first_name, last_name, email, hashed_password),
+            )
+            await conn.commit()
+    except psycopg.errors.UniqueViolation:
+        # Registered concurrently with the same email
+        return web.json_response({"message": "User already exists"}, status=400)
+    # The cached student list no longer matches the database
+    invalidate_students()
+    return web.json_response({"success": True}, status=201)
 
 
 routes = [
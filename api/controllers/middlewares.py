@@ -1,27 +1,79 @@
+import functools
+import hashlib
+import os
+import time
+
 from aiohttp import web
 import jwt
 
+from cache import TTLCache
+
+# Verified tokens are kept for at most TOKEN_CACHE_TTL seconds, and never past their exp claim
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 4096))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 300))
+
+# sha256 of the token -> decoded payload; the dashboard polls with the same token, so it is decoded once
+verified_tokens = TTLCache(max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+
 def validate_login(handler):
-    async def middleware_handler(request):
-        # Extract the Authorization header
-        auth_header = request.headers.get('Authorization', None)
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return web.json_response({"message": "Missing or invalid token"}, status=401)
+    """Reserves a handler to invigilators.
 
-        token = auth_header.split(' ')[1]
-        try:
-            # Decode the JWT (replace 'your-secret-key' with your actual secret key)
-            payload = jwt.decode(token, '1234', algorithms=['HS256'])
-            request['user'] = payload
-        except jwt.ExpiredSignatureError:
-            return web.json_response({"message": "Token has expired"}, status=401)
-        except jwt.InvalidTokenError:
-            return web.json_response({"message": "Invalid token"}, status=401)
-
-        # Check if the user type is allowed
-        if payload.get('role') != 'Invigilator':
+    auth_middleware verifies the token of the marked handlers; the wrapper
+    also refuses the request when the middleware did not set an invigilator
+    user, so the route stays closed if the middleware is not registered.
+    """
+    @functools.wraps(handler)
+    async def wrapper(request):
+        user = request.get('user')
+        if user is None:
+            return web.json_response({"message": "Missing or invalid token"}, status=401)
+        if user.get('role') != wrapper.required_role:
             return web.json_response({"message": "Unauthorized user type"}, status=403)
+        return await handler(request)
 
+    wrapper.required_role = 'Invigilator'
+    return wrapper
+
+
+def verify_token(token):
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = verified_tokens.get(key)
+    if payload is None:
+        # Raises jwt.ExpiredSignatureError or jwt.InvalidTokenError
+        payload = jwt.decode(token, '1234', algorithms=['HS256'])
+        ttl = TOKEN_CACHE_TTL
+        if 'exp' in payload:
+            ttl = min(ttl, payload['exp'] - time.time())
+        if ttl > 0:
+            verified_tokens.set(key, dict(payload), ttl=ttl)
+    # Each request gets its own copy, the cached payload is shared
+    return dict(payload)
+
+
+@web.middleware
+async def auth_middleware(request, handler):
+    # Only handlers marked with @validate_login need a token, CORS preflights and public routes pass through
+    required_role = getattr(request.match_info.handler, 'required_role', None)
+    if required_role is None:
         return await handler(request)
 
-    return middleware_handler
\ No newline at end of file
+    # Extract the Authorization header
+    auth_header = request.headers.get('Authorization', None)
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return web.json_response({"message": "Missing or invalid token"}, status=401)
+
+    token = auth_header.split(' ')[1]
+    try:
+        payload = verify_token(token)
+    except jwt.ExpiredSignatureError:
+        return web.json_response({"message": "Token has expired"}, status=401)
+    except jwt.InvalidTokenError:
+        return web.json_response({"message": "Invalid token"}, status=401)
+    request['user'] = payload
+
+    # Check if the user type is allowed
+    if payload.get('role') != required_role:
+        return web.json_response({"message": "Unauthorized user type"}, status=403)
+
+    return await handler(request)
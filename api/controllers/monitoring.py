@@ -0,0 +1,37 @@
+from aiohttp import web
+from controllers.middlewares import validate_login
+
+@validate_login
+async def find_db_stats(request):
+    # Pool size, connections in use, requests waiting and timeouts, see psycopg_pool's get_stats()
+    return web.json_response(request.app["db"].get_stats())
+
+@validate_login
+async def find_hashing_stats(request):
+    hasher = request.app["password_hasher"]
+    return web.json_response({
+        "queue_depth": hasher.queue_depth,
+        "in_flight": hasher.in_flight,
+        "workers": hasher.max_workers,
+        "rounds": hasher.rounds,
+    })
+
+@validate_login
+async def find_loop_stats(request):
+    # Lag in seconds; max_lag covers the time since the previous call with ?reset=1
+    monitor = request.app["loop_monitor"]
+    max_lag = monitor.reset() if request.query.get("reset") else monitor.max_lag
+    return web.json_response({"last_lag": monitor.last_lag, "max_lag": max_lag})
+
+@validate_login
+async def find_sessions(request):
+    # Connected students with the state of their peer connections and the admin watching them
+    return web.json_response(request.app["sessions"].snapshot())
+
+
+routes = [
+    web.get("/monitoring/db", find_db_stats),
+    web.get("/monitoring/hashing", find_hashing_stats),
+    web.get("/monitoring/loop", find_loop_stats),
+    web.get("/monitoring/sessions", find_sessions),
+]
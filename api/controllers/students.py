@@ -1,58 +1,175 @@
 from aiohttp import web
+import json
 import psycopg
+from datetime import datetime
+from cache import TTLCache, conditional_json_response, make_etag
 from controllers.middlewares import validate_login
 
+# Serialized student list and details with their ETag, invalidated when a user registers
+students_cache = TTLCache(max_size=1024, ttl=30.0)
+
+def invalidate_students():
+    students_cache.invalidate()
+
 @validate_login
 async def find(request):
-    db = request.app["db"]
-    async with db.cursor(row_factory=psycopg.rows.dict_row) as cur:
-        await cur.execute(
-            "SELECT id, first_name, last_name FROM users WHERE role = 'Student'"
-        )
-        rows = await cur.fetchall()
-        return web.json_response(rows)
+    entry = students_cache.get("students")
+    if entry is None:
+        # Taken before the query, a registration meanwhile keeps this result out of the cache
+        version = students_cache.version("students")
+        db = request.app["db"]
+        async with db.connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(
+                "SELECT id, first_name, last_name FROM users WHERE role = 'Student'"
+            )
+            rows = await cur.fetchall()
+        body = json.dumps(rows)
+        entry = (body, make_etag(body))
+        students_cache.set("students", entry, version=version)
+    return conditional_json_response(request, *entry)
 
 @validate_login
 async def find_by_id(request):
     id = request.match_info.get("id")
-    db = request.app["db"]
-    async with db.cursor(row_factory=psycopg.rows.dict_row) as cur:
-        await cur.execute("SELECT * FROM users WHERE id = %s", (id,))
-        row = await cur.fetchone()
+    entry = students_cache.get(("student", id))
+    if entry is None:
+        version = students_cache.version(("student", id))
+        db = request.app["db"]
+        async with db.connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+            await cur.execute(
+                "SELECT id, email, first_name, last_name, role FROM users WHERE id = %s", (id,)
+            )
+            row = await cur.fetchone()
         if row is None:
             return web.json_response({"message": "User not found"}, status=404)
-        return web.json_response(row)
+        body = json.dumps(row)
+        entry = (body, make_etag(body))
+        students_cache.set(("student", id), entry, version=version)
+    return conditional_json_response(request, *entry)
+
+# Page size of the suspicious activity history
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def parse_cursor(cursor):
+    """A cursor is the `timestamp,id` of the last row of the previous page"""
+    timestamp, row_id = cursor.rsplit(",", 1)
+    return datetime.fromisoformat(timestamp), int(row_id)
 
 @validate_login
 async def find_suspicious_activities(request):
     id = request.match_info.get("id")
+    try:
+        limit = min(int(request.query.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        since = request.query.get("since")
+        until = request.query.get("until")
+        cursor = request.query.get("cursor")
+        conditions = ["user_id = %s"]
+        params = [id]
+        if since:
+            conditions.append("timestamp >= %s")
+            params.append(datetime.fromisoformat(since))
+        if until:
+            conditions.append("timestamp < %s")
+            params.append(datetime.fromisoformat(until))
+        if cursor:
+            # Keyset pagination: continue right after the last row of the previous page
+            conditions.append("(timestamp, id) < (%s, %s)")
+            params.extend(parse_cursor(cursor))
+    except ValueError:
+        return web.json_response({"message": "Invalid limit, since, until or cursor"}, status=400)
+    if limit <= 0:
+        return web.json_response({"message": "Invalid limit, since, until or cursor"}, status=400)
+
     db = request.app["db"]
-    async with db.cursor(row_factory=psycopg.rows.dict_row) as cur:
+    async with db.connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+        # One row more than the page to know whether there is a next page
         await cur.execute(
-            "SELECT id, activity, timestamp FROM user_suspicious_activities WHERE user_id = %s ORDER BY timestamp DESC", (id,)
+            "SELECT id, activity, timestamp AS cursor_timestamp, "
+            "to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS') AS timestamp, "
+            "to_char(ended_at, 'YYYY-MM-DD HH24:MI:SS') AS ended_at "
+            "FROM user_suspicious_activities a WHERE " + " AND ".join(conditions) + " "
+            # a.timestamp is the column, a bare timestamp would sort by the formatted text
+            "ORDER BY a.timestamp DESC, a.id DESC LIMIT %s",
+            (*params, limit + 1),
         )
         rows = await cur.fetchall()
-        for row in rows:
-            row["timestamp"] = row["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-        
-        return web.json_response(rows)
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = f"{last['cursor_timestamp'].isoformat()},{last['id']}"
+    for row in rows:
+        del row["cursor_timestamp"]
+
+    return web.json_response(rows, headers=headers)
+
+@validate_login
+async def find_summary(request):
+    """Aggregates of one student, read from the summary tables kept by the activity writer"""
+    id = request.match_info.get("id")
+    db = request.app["db"]
+    async with db.connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+        await cur.execute(
+            "SELECT activity, count, total_seconds, to_char(last_seen, 'YYYY-MM-DD HH24:MI:SS') AS last_seen "
+            "FROM user_activity_summary WHERE user_id = %s",
+            (id,),
+        )
+        activities = await cur.fetchall()
+        await cur.execute(
+            "SELECT activity, to_char(bucket, 'YYYY-MM-DD HH24:MI:SS') AS bucket, count "
+            "FROM user_activity_histogram WHERE user_id = %s ORDER BY bucket",
+            (id,),
+        )
+        histogram = await cur.fetchall()
+
+    looking_away = next((row["total_seconds"] for row in activities if row["activity"] == "Looking away"), 0)
+    return web.json_response({
+        "activities": activities,
+        "looking_away_seconds": looking_away,
+        "histogram": histogram,
+    })
+
+@validate_login
+async def find_exam_summary(request):
+    """Aggregates of every student of the exam, per student and per activity"""
+    db = request.app["db"]
+    async with db.connection() as conn, conn.cursor(row_factory=psycopg.rows.dict_row) as cur:
+        await cur.execute(
+            "SELECT user_id, activity, count, total_seconds FROM user_activity_summary ORDER BY user_id"
+        )
+        rows = await cur.fetchall()
+
+    students = {}
+    totals = {}
+    for row in rows:
+        student = students.setdefault(row["user_id"], {"user_id": row["user_id"], "counts": {}, "looking_away_seconds": 0})
+        student["counts"][row["activity"]] = row["count"]
+        if row["activity"] == "Looking away":
+            student["looking_away_seconds"] = row["total_seconds"]
+        totals[row["activity"]] = totals.get(row["activity"], 0) + row["count"]
+
+    return web.json_response({"totals": totals, "students": list(students.values())})
 
 async def add_suspicious_activity(request):
     data = await request.json()
     id = request.match_info.get("id")
     activity = data.get("activity")
     db = request.app["db"]
-    async with db.cursor() as cur:
+    async with db.connection() as conn, conn.cursor() as cur:
         await cur.execute(
             "INSERT INTO user_suspicious_activities (user_id, activity) VALUES (%s, %s)",
             (id, activity),
         )
-        await db.commit()
+        await conn.commit()
         return web.json_response({"message": "Suspicious activity added"}, status=201)
 
 
 routes = [
     web.get("/students", find),
+    web.get("/students/summary", find_exam_summary),
     web.get("/students/{id}", find_by_id),
     web.get("/students/{id}/suspicious-activities", find_suspicious_activities),
+    web.get("/students/{id}/summary", find_summary),
 ]
@@ -13,14 +13,39 @@ CREATE TABLE IF NOT EXISTS users (
 
 DROP type IF EXISTS suspicious_activity;
 
-CREATE TYPE suspicious_activity AS ENUM ('Multiple faces', 'No face', 'Looking away');
+CREATE TYPE suspicious_activity AS ENUM ('Multiple faces', 'No face', 'Looking away', 'Prohibited object');
 
 DROP TABLE IF EXISTS user_suspicious_activities;
 CREATE TABLE IF NOT EXISTS user_suspicious_activities (
     id SERIAL PRIMARY KEY,
     user_id INT NOT NULL REFERENCES users ON DELETE CASCADE,
     activity suspicious_activity NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ended_at TIMESTAMP,
+    confidence REAL
+);
+
+CREATE INDEX IF NOT EXISTS user_suspicious_activities_user_timestamp_idx
+    ON user_suspicious_activities (user_id, timestamp DESC, id DESC);
+
+-- Per-student aggregates kept up to date by the activity writer
+DROP TABLE IF EXISTS user_activity_summary;
+CREATE TABLE IF NOT EXISTS user_activity_summary (
+    user_id INT NOT NULL REFERENCES users ON DELETE CASCADE,
+    activity suspicious_activity NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    total_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_seen TIMESTAMP,
+    PRIMARY KEY (user_id, activity)
+);
+
+DROP TABLE IF EXISTS user_activity_histogram;
+CREATE TABLE IF NOT EXISTS user_activity_histogram (
+    user_id INT NOT NULL REFERENCES users ON DELETE CASCADE,
+    activity suspicious_activity NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, activity, bucket)
 );
 
 -- create studnet user
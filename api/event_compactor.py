@@ -0,0 +1,72 @@
+import uuid
+from datetime import datetime
+
+# Seconds an activity must keep being observed before its interval is opened
+MIN_DURATION = 1.0
+# Seconds an activity must stay unobserved before its interval is closed
+RELEASE_TIME = 2.0
+
+
+class EventCompactor:
+    """Turns per-frame verdicts into activity intervals.
+
+    An activity opens an interval only after being observed for MIN_DURATION
+    seconds, and closes it only after being absent for RELEASE_TIME seconds,
+    so single-frame flicker never produces an event. `update` returns only
+    the interval opens and closes; both events of an interval share its key.
+    """
+
+    def __init__(self, min_duration=MIN_DURATION, release_time=RELEASE_TIME):
+        self.min_duration = min_duration
+        self.release_time = release_time
+        # activity -> {"key", "start", "last_seen", "peak"} for activities not yet long enough to open
+        self.candidates = {}
+        # activity -> {"key", "start", "last_seen", "peak"} for open intervals
+        self.open = {}
+
+    def update(self, observations, now=None):
+        """Feed the {activity: confidence} observed in one frame, returns the open/close events"""
+        now = now or datetime.now()
+        events = []
+
+        for activity, confidence in observations.items():
+            interval = self.open.get(activity) or self.candidates.get(activity)
+            if interval is None:
+                interval = self.candidates[activity] = {
+                    "key": uuid.uuid4().hex, "start": now, "last_seen": now, "peak": confidence,
+                }
+            interval["last_seen"] = now
+            interval["peak"] = max(interval["peak"], confidence)
+
+            if activity in self.candidates and (now - interval["start"]).total_seconds() >= self.min_duration:
+                self.open[activity] = self.candidates.pop(activity)
+                events.append(self._event("open", activity, interval))
+
+        for activity, interval in list(self.candidates.items()):
+            if activity not in observations and (now - interval["last_seen"]).total_seconds() >= self.release_time:
+                del self.candidates[activity]
+
+        for activity, interval in list(self.open.items()):
+            if activity not in observations and (now - interval["last_seen"]).total_seconds() >= self.release_time:
+                del self.open[activity]
+                events.append(self._event("close", activity, interval))
+
+        return events
+
+    def close_all(self):
+        """Close every open interval, e.g. when the stream ends"""
+        events = [self._event("close", activity, interval) for activity, interval in self.open.items()]
+        self.open = {}
+        self.candidates = {}
+        return events
+
+    @staticmethod
+    def _event(state, activity, interval):
+        return {
+            "state": state,
+            "key": interval["key"],
+            "activity": activity,
+            "start": interval["start"],
+            "end": interval["last_seen"] if state == "close" else None,
+            "confidence": float(interval["peak"]),
+        }
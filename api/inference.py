@@ -0,0 +1,42 @@
+import os
+
+from bounded_executor import BoundedExecutor
+from logger import log
+from ml_models.object_detector import yolo_available
+from object_batcher import ObjectDetectionBatcher
+
+# Inference settings
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", os.cpu_count() or 2))
+# Maximum number of frames submitted at once (running + queued), further submitters wait
+INFERENCE_MAX_PENDING = int(os.environ.get("INFERENCE_MAX_PENDING", INFERENCE_WORKERS * 2))
+
+
+class InferenceExecutor(BoundedExecutor):
+    """Runs the blocking ML inference off the asyncio event loop.
+
+    OpenCV releases the GIL while it works, so the colour conversions and
+    the YOLO forward passes of several frames run in parallel. The face
+    analysis runs in the analysis processes (see analysis_workers); it only
+    runs here when ANALYSIS_PROCESSES is 0 or a process is being restarted.
+    dlib's Python bindings hold the GIL during a HOG scan, so in that
+    fallback the event loop waits for each scan. Each thread has its own
+    dlib detector (see ml_models.get_face_detector).
+    """
+
+    def __init__(self, max_workers=INFERENCE_WORKERS, max_pending=INFERENCE_MAX_PENDING):
+        super().__init__(max_workers, max_pending, thread_name_prefix="inference")
+
+
+async def start_inference(app):
+    app["inference"] = InferenceExecutor()
+    log.info(f"Inference executor started with {INFERENCE_WORKERS} workers")
+
+    # Object detection is skipped when the YOLO weights have not been downloaded
+    if yolo_available():
+        app["object_batcher"] = ObjectDetectionBatcher(app["inference"])
+    else:
+        app["object_batcher"] = None
+        log.warning("YOLO weights not found, object detection disabled")
+
+async def stop_inference(app):
+    app["inference"].shutdown()
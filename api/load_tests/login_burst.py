@@ -0,0 +1,78 @@
+"""Login burst scenario: many students logging in at exam start.
+
+Fires COUNT concurrent logins at the API while polling /monitoring/loop,
+the event loop lag of the server. Every VideoTransformTrack.recv runs on
+that same loop, so the lag measured during the burst is the extra delay
+a video frame would see. With bcrypt on the password hasher's threads the
+max lag stays in the milliseconds; with bcrypt on the loop it grows to
+seconds.
+
+    python api/main.py
+    python api/load_tests/login_burst.py --count 300
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+
+async def login(session, url, email, password):
+    start = time.perf_counter()
+    async with session.post(f"{url}/authorization/login", json={"email": email, "password": password}) as response:
+        body = await response.json()
+        return response.status, time.perf_counter() - start, body
+
+
+async def poll_loop_lag(session, url, headers, stop, samples):
+    while not stop.is_set():
+        async with session.get(f"{url}/monitoring/loop", params={"reset": "1"}, headers=headers) as response:
+            samples.append((await response.json())["max_lag"])
+        await asyncio.sleep(0.2)
+
+
+async def main(args):
+    async with aiohttp.ClientSession() as session:
+        # The monitoring endpoints need an invigilator token
+        status, _, body = await login(session, args.url, args.admin_email, args.admin_password)
+        if status != 200:
+            raise SystemExit(f"Invigilator login failed: {body}")
+        headers = {"Authorization": f"Bearer {body['token']}"}
+
+        # Baseline before the burst
+        await session.get(f"{args.url}/monitoring/loop", params={"reset": "1"}, headers=headers)
+        await asyncio.sleep(1)
+        async with session.get(f"{args.url}/monitoring/loop", params={"reset": "1"}, headers=headers) as response:
+            baseline = (await response.json())["max_lag"]
+
+        stop = asyncio.Event()
+        samples = []
+        poller = asyncio.create_task(poll_loop_lag(session, args.url, headers, stop, samples))
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            login(session, args.url, args.email, args.password) for _ in range(args.count)
+        ])
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        await poller
+
+    latencies = sorted(latency for _, latency, _ in results)
+    failures = sum(1 for status, _, _ in results if status != 200)
+    print(f"{args.count} logins in {elapsed:.2f}s ({args.count / elapsed:.1f}/s), {failures} failed")
+    print(f"login latency p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms")
+    print(f"event loop max lag: baseline {baseline * 1000:.1f} ms, "
+          f"during burst {max(samples, default=0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5002")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--email", default="student@gmail.com")
+    parser.add_argument("--password", default="1234")
+    parser.add_argument("--admin-email", default="admin@gmail.com")
+    parser.add_argument("--admin-password", default="1234")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+# How often the event loop lag is sampled, in seconds
+SAMPLE_INTERVAL = 0.1
+
+
+class LoopMonitor:
+    """Measures how late the event loop wakes up a sleeping task.
+
+    Every coroutine on the loop (video track recv, Socket.IO signalling,
+    request handlers) is delayed by that much, so the lag shows whether
+    blocking work is stalling the loop.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def reset(self):
+        """Returns the max lag since the previous reset and starts a new window"""
+        max_lag, self.max_lag = self.max_lag, 0.0
+        return max_lag
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.max_lag = max(self.max_lag, self.last_lag)
+
+
+async def start_loop_monitor(app):
+    app["loop_monitor"] = LoopMonitor()
+    app["loop_monitor"].start()
+
+async def stop_loop_monitor(app):
+    app["loop_monitor"].stop()
@@ -5,11 +5,23 @@ from logger import log
 from webrtc import app
 
 import db
+import activity_writer
+import activity_notifier
+import inference
+import analysis_workers
+import password_hasher
+import loop_monitor
 
-from controllers import authorization, students
+from controllers import analysis, authorization, monitoring, students
+from controllers.middlewares import auth_middleware
+
+# Checks the token of every handler marked with @validate_login
+app.middlewares.append(auth_middleware)
 
 app.add_routes(authorization.routes)
 app.add_routes(students.routes)
+app.add_routes(analysis.routes)
+app.add_routes(monitoring.routes)
 
 # Configure default CORS settings
 cors = aiohttp_cors.setup(app, defaults={
@@ -32,6 +44,24 @@ for route in list(app.router.routes()):
 if __name__ == "__main__":
     # connect to the postgres database
     app.on_startup.append(db.connect)
+    # write suspicious activities in bulk, stopped before the pool is closed
+    app.on_startup.append(activity_writer.start_activity_writer)
+    app.on_cleanup.append(activity_writer.stop_activity_writer)
     app.on_cleanup.append(db.close_db)
+    # send suspicious activities to the admins in batches
+    app.on_startup.append(activity_notifier.start_activity_notifier)
+    app.on_cleanup.append(activity_notifier.stop_activity_notifier)
+    # run the ML inference off the event loop
+    app.on_startup.append(inference.start_inference)
+    app.on_cleanup.append(inference.stop_inference)
+    # analyse faces in ANALYSIS_PROCESSES separate processes, sharded by student
+    app.on_startup.append(analysis_workers.start_analysis_workers)
+    app.on_cleanup.append(analysis_workers.stop_analysis_workers)
+    # hash and check passwords off the event loop
+    app.on_startup.append(password_hasher.start_password_hasher)
+    app.on_cleanup.append(password_hasher.stop_password_hasher)
+    # measure how late the event loop runs its callbacks
+    app.on_startup.append(loop_monitor.start_loop_monitor)
+    app.on_cleanup.append(loop_monitor.stop_loop_monitor)
     web.run_app(app, host="0.0.0.0", port=5002)
     log.debug("Starting WebRTC server on port 5002")
\ No newline at end of file
@@ -0,0 +1,2 @@
+-- Object detection in the video analysis reports prohibited objects (phone, book, laptop)
+ALTER TYPE suspicious_activity ADD VALUE IF NOT EXISTS 'Prohibited object';
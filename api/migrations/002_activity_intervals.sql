@@ -0,0 +1,3 @@
+-- Suspicious activities are stored as intervals: timestamp is the start, ended_at is set when the interval closes
+ALTER TABLE user_suspicious_activities ADD COLUMN IF NOT EXISTS ended_at TIMESTAMP;
+ALTER TABLE user_suspicious_activities ADD COLUMN IF NOT EXISTS confidence REAL;
@@ -0,0 +1,3 @@
+-- Keyset pagination of a student's suspicious activity history, newest first
+CREATE INDEX IF NOT EXISTS user_suspicious_activities_user_timestamp_idx
+    ON user_suspicious_activities (user_id, timestamp DESC, id DESC);
@@ -0,0 +1,33 @@
+-- Per-student aggregates kept up to date by the activity writer, read by the summary endpoints
+CREATE TABLE IF NOT EXISTS user_activity_summary (
+    user_id INT NOT NULL REFERENCES users ON DELETE CASCADE,
+    activity suspicious_activity NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    total_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_seen TIMESTAMP,
+    PRIMARY KEY (user_id, activity)
+);
+
+CREATE TABLE IF NOT EXISTS user_activity_histogram (
+    user_id INT NOT NULL REFERENCES users ON DELETE CASCADE,
+    activity suspicious_activity NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, activity, bucket)
+);
+
+-- Backfill from the existing history
+INSERT INTO user_activity_summary (user_id, activity, count, total_seconds, last_seen)
+SELECT user_id, activity, COUNT(*),
+       COALESCE(SUM(EXTRACT(EPOCH FROM ended_at - timestamp)), 0), MAX(timestamp)
+FROM user_suspicious_activities
+GROUP BY user_id, activity
+ON CONFLICT (user_id, activity) DO NOTHING;
+
+INSERT INTO user_activity_histogram (user_id, activity, bucket, count)
+SELECT user_id, activity,
+       date_trunc('hour', timestamp) + FLOOR(EXTRACT(MINUTE FROM timestamp) / 5) * INTERVAL '5 minutes',
+       COUNT(*)
+FROM user_suspicious_activities
+GROUP BY 1, 2, 3
+ON CONFLICT (user_id, activity, bucket) DO NOTHING;
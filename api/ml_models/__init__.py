@@ -1,31 +1,107 @@
-import cv2
-import dlib
+import threading
+
 import cv2
 import dlib
 from logger import log
 
-face_detector = dlib.get_frontal_face_detector()
-log.warning("Face detector initialized")
+# dlib's HOG detector loads the image it scans into its own scanner, so one detector cannot
+# be used by two inference threads at once; every thread gets its own on first use
+_thread_local = threading.local()
+
+def get_face_detector():
+    """Face detector of the calling thread"""
+    detector = getattr(_thread_local, "face_detector", None)
+    if detector is None:
+        detector = _thread_local.face_detector = dlib.get_frontal_face_detector()
+        log.warning(f"Face detector initialized for {threading.current_thread().name}")
+    return detector
+
+def to_gray(image):
+    """Grayscale version of a BGR image, grayscale images are returned as they are"""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
 def detect_faces(image):
     """Face detection using dlib"""
     try:
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        faces = face_detector(gray)
+        gray = to_gray(image)
+        faces = get_face_detector()(gray)
         return len(faces), faces
     except Exception as e:
         log.error(f"Face detection error: {e}")
         return 0, []
 
-def estimate_head_pose(faces, image):
-    """Simple head pose estimation based on face position"""
+class FaceTracker:
+    """Detect-then-track face detection for one video stream.
+
+    A full HOG detection runs every `detect_every` frames, or as soon as a
+    tracker's confidence drops; the frames in between only update one dlib
+    correlation tracker per face, seeded from the last detected rectangle.
+    """
+
+    def __init__(self, detect_every=10, min_confidence=7.0):
+        self.detect_every = detect_every
+        self.min_confidence = min_confidence
+        self.trackers = []
+        self.frames_since_detection = 0
+
+    def reset(self):
+        self.trackers = []
+        self.frames_since_detection = 0
+
+    def _detect(self, gray):
+        faces = get_face_detector()(gray)
+        self.trackers = []
+        for face in faces:
+            tracker = dlib.correlation_tracker()
+            tracker.start_track(gray, face)
+            self.trackers.append(tracker)
+        self.frames_since_detection = 0
+        return faces
+
+    def _track(self, gray):
+        faces = dlib.rectangles()
+        for tracker in self.trackers:
+            if tracker.update(gray) < self.min_confidence:
+                return None
+            position = tracker.get_position()
+            faces.append(dlib.rectangle(
+                int(position.left()), int(position.top()),
+                int(position.right()), int(position.bottom()),
+            ))
+        return faces
+
+    def detect(self, image):
+        """Same result as detect_faces, detecting only when tracking is not enough"""
+        try:
+            gray = to_gray(image)
+            faces = None
+            if self.trackers and self.frames_since_detection < self.detect_every:
+                faces = self._track(gray)
+            if faces is None:
+                faces = self._detect(gray)
+            else:
+                self.frames_since_detection += 1
+            return len(faces), faces
+        except Exception as e:
+            log.error(f"Face tracking error: {e}")
+            self.reset()
+            return 0, []
+
+def estimate_head_pose(faces, image, scale=1):
+    """Simple head pose estimation based on face position.
+
+    `scale` maps the image back to the full frame when it was decimated, the
+    thresholds are in full frame pixels.
+    """
     if not faces:
         return -1
     try:
         face = faces[0]
         # Get face center
-        center_x = face.left() + face.width() // 2
-        image_center = image.shape[1] // 2
+        center_x = (face.left() + face.width() // 2) * scale
+        image_center = image.shape[1] * scale // 2
         
         # Simple left/right estimation based on face position
         if center_x > image_center + 50:  # Right threshold
@@ -38,6 +114,27 @@ def estimate_head_pose(faces, image):
         log.error(f"Head pose estimation error: {e}")
         return -1
 
+def classify_frame(face_tracker, image, scale=1):
+    """Suspicious activity seen in one frame: "No face", "Multiple faces", "Looking away" or None"""
+    try:
+        face_count, faces = face_tracker.detect(image)
+        log.info(f"Face detection - Count: {face_count}")
+        if face_count == 1:
+            head_pos = estimate_head_pose([faces[0]], image, scale)
+            log.info(f"Head position: {head_pos}")
+            if head_pos != "center":
+                return "Looking away"
+            return None
+        elif face_count > 1:
+            log.info("Multiple faces detected")
+            return "Multiple faces"
+        else:
+            log.info("No face detected")
+            return "No face"
+    except Exception as e:
+        log.error(f"Error processing frame: {e}")
+        return None
+
 def convert_opencv_to_dlib_rect(rect):
     """Convert OpenCV rectangle (x, y, w, h) to dlib rectangle"""
     if isinstance(rect, dlib.rectangle):
@@ -0,0 +1,84 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from logger import log
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "object_detection")
+WEIGHTS_PATH = os.path.join(MODEL_DIR, "weights", "yolov3-tiny.weights")
+CONFIG_PATH = os.path.join(MODEL_DIR, "config", "yolov3-tiny.cfg")
+LABELS_PATH = os.path.join(MODEL_DIR, "objectLabels", "coco.names")
+
+INPUT_SIZE = (220, 220)
+CONFIDENCE_THRESHOLD = 0.5
+NMS_THRESHOLD = 0.4
+# Objects that count as suspicious when seen in a student's frame
+PROHIBITED_OBJECTS = {"cell phone", "book", "laptop"}
+
+_model = None
+_model_lock = threading.Lock()
+# cv2.dnn.Net keeps its input and activations in the object, one forward pass at a time
+_forward_lock = threading.Lock()
+
+
+def yolo_available():
+    return os.path.exists(WEIGHTS_PATH)
+
+
+def load_yolo():
+    """Load YOLO once, on first use; returns (net, output layers, labels)"""
+    global _model
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            net = cv2.dnn.readNet(WEIGHTS_PATH, CONFIG_PATH)
+            with open(LABELS_PATH, "r") as file:
+                labels = [name.strip() for name in file.readlines()]
+            layer_names = net.getLayerNames()
+            output_layers = [layer_names[i - 1] for i in np.array(net.getUnconnectedOutLayers()).flatten()]
+            _model = (net, output_layers, labels)
+            log.warning("Object detector initialized")
+    return _model
+
+
+def decode_detections(detections, width, height, labels):
+    """Vectorized decoding of the YOLO rows of one image into [(label, confidence), ...]"""
+    scores = detections[:, 5:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+
+    keep = confidences > CONFIDENCE_THRESHOLD
+    if not keep.any():
+        return []
+    detections, class_ids, confidences = detections[keep], class_ids[keep], confidences[keep]
+
+    # Center/size relative coordinates to (x, y, w, h) pixel boxes
+    sizes = detections[:, 2:4] * (width, height)
+    corners = detections[:, 0:2] * (width, height) - sizes / 2
+    boxes = np.hstack((corners, sizes)).astype(np.int32)
+
+    indexes = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(), CONFIDENCE_THRESHOLD, NMS_THRESHOLD)
+    indexes = np.array(indexes, dtype=np.int64).reshape(-1)
+    return [(labels[class_ids[i]], float(confidences[i])) for i in indexes]
+
+
+def detect_objects_batch(images):
+    """Run YOLO in a single forward pass over a list of BGR images"""
+    net, output_layers, labels = load_yolo()
+    blob = cv2.dnn.blobFromImages(images, 0.00392, INPUT_SIZE, (0, 0, 0), True, crop=False)
+    with _forward_lock:
+        net.setInput(blob)
+        outs = net.forward(output_layers)
+
+    # Depending on the OpenCV version a batch comes out as (N, rows, 85) or (N * rows, 85)
+    outs = [out.reshape(len(images), -1, out.shape[-1]) for out in outs]
+
+    results = []
+    for index, image in enumerate(images):
+        height, width = image.shape[:2]
+        detections = np.concatenate([out[index] for out in outs])
+        results.append(decode_detections(detections, width, height, labels))
+    return results
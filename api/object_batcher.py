@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+from ml_models.object_detector import detect_objects_batch
+from logger import log
+
+# Batching settings: how long a frame waits for other students' frames, and the largest batch
+BATCH_WINDOW = float(os.environ.get("OBJECT_BATCH_WINDOW", 0.02))
+MAX_BATCH_SIZE = int(os.environ.get("OBJECT_MAX_BATCH_SIZE", 16))
+
+
+class ObjectDetectionBatcher:
+    """Micro-batches object detection across all the video tracks.
+
+    Frames submitted within BATCH_WINDOW seconds of each other are sent to
+    YOLO as one N-image blob, so the per-call overhead of the forward pass
+    is paid once per batch instead of once per student. Only one batch runs
+    at a time, the shared network is not thread-safe; frames arriving
+    meanwhile are collected into the next batch.
+    """
+
+    def __init__(self, executor, window=BATCH_WINDOW, max_batch_size=MAX_BATCH_SIZE):
+        self.executor = executor
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pending = []
+        self.running = False
+        self._flush_handle = None
+
+    async def detect(self, image):
+        """Returns [(label, confidence), ...] for the image once its batch has run"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((image, future))
+
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self.running or not self.pending:
+            # The running batch flushes the frames collected meanwhile when it is done
+            return
+        batch = self.pending[:self.max_batch_size]
+        self.pending = self.pending[self.max_batch_size:]
+        self.running = True
+        asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            results = await self.executor.run(detect_objects_batch, [image for image, _ in batch])
+        except Exception as e:
+            log.error(f"Object detection error: {e}")
+            results = [[] for _ in batch]
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+        self.running = False
+        self._flush()
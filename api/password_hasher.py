@@ -0,0 +1,48 @@
+import os
+
+import bcrypt
+
+from bounded_executor import BoundedExecutor
+from logger import log
+
+# Password hashing settings
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", 2))
+# Maximum number of hashes submitted at once (running + queued), further logins wait their turn
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", 256))
+
+
+class PasswordHasher(BoundedExecutor):
+    """Runs bcrypt on a small dedicated thread pool.
+
+    bcrypt burns 100-300 ms of CPU per call; on its own pool (bcrypt
+    releases the GIL) a login burst no longer stalls the event loop that
+    carries signalling and video analysis, and it cannot starve the
+    inference executor either.
+    """
+
+    def __init__(self, max_workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, rounds=BCRYPT_ROUNDS):
+        super().__init__(max_workers, max_pending, thread_name_prefix="bcrypt")
+        self.rounds = rounds
+
+    async def hash(self, plain_password):
+        return await self.run(hash_password, plain_password, self.rounds)
+
+    async def check(self, plain_password, hashed_password):
+        return await self.run(
+            bcrypt.checkpw, plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
+
+
+def hash_password(plain_password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
+    hashed = bcrypt.hashpw(plain_password.encode("utf-8"), salt)
+    return hashed.decode("utf-8")
+
+
+async def start_password_hasher(app):
+    app["password_hasher"] = PasswordHasher()
+    log.info(f"Password hasher started with {HASH_WORKERS} workers, bcrypt rounds {BCRYPT_ROUNDS}")
+
+async def stop_password_hasher(app):
+    app["password_hasher"].shutdown()
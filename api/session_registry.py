@@ -0,0 +1,105 @@
+import time
+
+
+class SessionRegistry:
+    """Peer connections of the students and the admins watching them.
+
+    Connections are indexed by socket id and by student id, and admin
+    subscriptions by socket id, by student id and by exam id, so connecting,
+    disconnecting and looking up who to notify are O(1) whatever the number
+    of students. Any number of admins can watch a student or a whole exam.
+    A student stays registered while at least one of its connections is
+    open; subscriptions last until the admin disconnects.
+    """
+
+    def __init__(self):
+        # socket id -> set of peer connections opened by that socket
+        self.peers_by_sid = {}
+        # student id -> set of peer connections, the set size is the student's reference count
+        self.peers_by_student = {}
+        # student id -> socket ids of the admins watching the student
+        self.admins_by_student = {}
+        # admin socket id -> set of student ids it watches
+        self.students_by_admin = {}
+        # exam id -> socket ids of the admins watching every student of the exam
+        self.admins_by_exam = {}
+        # admin socket id -> set of exam ids it watches
+        self.exams_by_admin = {}
+
+    def add_peer(self, pc):
+        pc.connected_at = time.time()
+        self.peers_by_sid.setdefault(pc.socket_id, set()).add(pc)
+        self.peers_by_student.setdefault(pc.student_id, set()).add(pc)
+
+    def remove_peer(self, pc):
+        """Unregister a connection, returns False when it was not registered"""
+        peers = self.peers_by_student.get(pc.student_id)
+        if peers is None or pc not in peers:
+            return False
+        peers.discard(pc)
+        if not peers:
+            # The admins watching the student keep their subscription for when it reconnects
+            del self.peers_by_student[pc.student_id]
+        sid_peers = self.peers_by_sid.get(pc.socket_id)
+        if sid_peers is not None:
+            sid_peers.discard(pc)
+            if not sid_peers:
+                del self.peers_by_sid[pc.socket_id]
+        return True
+
+    def peers_for_sid(self, sid):
+        return list(self.peers_by_sid.get(sid, ()))
+
+    def add_admin(self, student_id, sid):
+        self.admins_by_student.setdefault(student_id, set()).add(sid)
+        self.students_by_admin.setdefault(sid, set()).add(student_id)
+
+    def watch_exam(self, exam_id, sid):
+        self.admins_by_exam.setdefault(exam_id, set()).add(sid)
+        self.exams_by_admin.setdefault(sid, set()).add(exam_id)
+
+    def subscribers(self, student_id, exam_id=None):
+        """Socket ids of the admins watching the student or its exam"""
+        return self.admins_by_student.get(student_id, set()) | self.admins_by_exam.get(exam_id, set())
+
+    def remove_admin_sid(self, sid):
+        """Forget every student and exam watched by a disconnected admin"""
+        for student_id in self.students_by_admin.pop(sid, ()):
+            _discard(self.admins_by_student, student_id, sid)
+        for exam_id in self.exams_by_admin.pop(sid, ()):
+            _discard(self.admins_by_exam, exam_id, sid)
+
+    def snapshot(self):
+        """Per-student session state for monitoring"""
+        now = time.time()
+        return {
+            "students": len(self.peers_by_student),
+            "admins": len(self.students_by_admin.keys() | self.exams_by_admin.keys()),
+            "exams": {exam_id: sorted(sids) for exam_id, sids in self.admins_by_exam.items()},
+            "sessions": [
+                {
+                    "studentId": student_id,
+                    "admins": sorted(self.admins_by_student.get(student_id, ())),
+                    "connections": [
+                        {
+                            "socketId": pc.socket_id,
+                            "examId": getattr(pc, "exam_id", None),
+                            "connectionState": pc.connectionState,
+                            "iceConnectionState": pc.iceConnectionState,
+                            "age": round(now - pc.connected_at, 1),
+                        }
+                        for pc in peers
+                    ],
+                }
+                for student_id, peers in self.peers_by_student.items()
+            ],
+        }
+
+
+def _discard(index, key, value):
+    """Remove value from the set index[key], dropping the key once its set is empty"""
+    values = index.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del index[key]
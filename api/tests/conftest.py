@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The api modules import each other by their flat names, as when the server is started from api/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import psycopg
+import pytest
+
+import activity_writer
+from activity_writer import ActivityWriter, MAX_REPLAY_ATTEMPTS
+
+T0 = datetime(2024, 5, 1, 9, 0, 0)
+
+
+class FakeDatabase:
+    """Records what each committed transaction wrote; `down` fails every connection, `rejected` user ids fail COPY"""
+
+    def __init__(self):
+        self.down = False
+        self.rejected = set()
+        self.next_id = 1
+        # row id -> {"user_id", "activity", "start", "end"}
+        self.rows = {}
+        self.summary = {}
+        self.commits = 0
+        # Raised when the connection goes back to the pool, after the commit
+        self.error_on_release = None
+
+    @asynccontextmanager
+    async def connection(self):
+        if self.down:
+            raise psycopg.OperationalError("connection refused")
+        conn = FakeConnection(self)
+        yield conn
+        if self.error_on_release is not None:
+            error, self.error_on_release = self.error_on_release, None
+            raise error
+
+    def activities(self):
+        return [(row["user_id"], row["activity"], row["end"] is not None) for row in self.rows.values()]
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.rows = {}
+        self.updates = []
+        self.summary = []
+
+    @asynccontextmanager
+    async def cursor(self):
+        yield FakeCursor(self)
+
+    async def commit(self):
+        self.db.rows.update(self.rows)
+        for row_id, end in self.updates:
+            self.db.rows[row_id]["end"] = end
+        for key, count in self.summary:
+            self.db.summary[key] = self.db.summary.get(key, 0) + count
+        self.db.commits += 1
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    async def execute(self, query, params):
+        assert query == activity_writer.ALLOCATE_IDS_QUERY
+        db = self.conn.db
+        self.result = [(row_id,) for row_id in range(db.next_id, db.next_id + params[0])]
+        db.next_id += params[0]
+
+    async def fetchall(self):
+        return self.result
+
+    @asynccontextmanager
+    async def copy(self, statement):
+        yield self
+
+    async def write_row(self, values):
+        row_id, user_id, activity, start, _ = values
+        if user_id in self.conn.db.rejected:
+            raise psycopg.DataError(f"user {user_id} rejected")
+        self.conn.rows[row_id] = {"user_id": user_id, "activity": activity, "start": start, "end": None}
+
+    async def executemany(self, query, params):
+        if query == activity_writer.UPDATE_QUERY:
+            self.conn.updates += [(row_id, end) for end, _, row_id in params]
+        elif query == activity_writer.UPDATE_BY_START_QUERY:
+            rows = {**self.conn.db.rows, **self.conn.rows}
+            for end, _, user_id, activity, start in params:
+                for row_id, row in rows.items():
+                    if (row["user_id"], row["activity"], row["start"], row["end"]) == (user_id, activity, start, None):
+                        self.conn.updates.append((row_id, end))
+        elif query == activity_writer.SUMMARY_OPEN_QUERY:
+            self.conn.summary += [((user_id, activity), count) for user_id, activity, count, _ in params]
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    fallback = tmp_path / "pending_activities.jsonl"
+    monkeypatch.setattr(activity_writer, "FALLBACK_PATH", str(fallback))
+    monkeypatch.setattr(activity_writer, "CLAIMED_PATH", str(fallback) + ".replaying")
+    monkeypatch.setattr(activity_writer, "QUARANTINE_PATH", str(fallback) + ".rejected")
+    return tmp_path
+
+
+def event(state, key, activity="Looking left", start=T0):
+    return {
+        "state": state,
+        "key": key,
+        "activity": activity,
+        "start": start,
+        "end": start + timedelta(seconds=3) if state == "close" else None,
+        "confidence": 1.0,
+    }
+
+
+def rows_for(writer, *events, user_id=1):
+    """The queued rows of events, as _run would batch them"""
+    for item in events:
+        writer.add(user_id, item)
+    rows = []
+    while not writer.queue.empty():
+        rows.append(writer.queue.get_nowait())
+    return rows
+
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+async def settle(writer):
+    # Wait for the appends and rewrites queued on the fallback thread
+    await asyncio.get_running_loop().run_in_executor(writer._files, lambda: None)
+
+
+async def replay_now(writer, rows=()):
+    writer._next_replay = 0.0
+    await writer._flush(list(rows))
+    await settle(writer)
+
+
+def test_open_and_close_are_written_and_closed_by_id(paths):
+    async def scenario():
+        db = FakeDatabase()
+        writer = ActivityWriter(db)
+        await writer._flush(rows_for(writer, event("open", "a")))
+        await writer._flush(rows_for(writer, event("close", "a")))
+        await writer.stop()
+        return db, writer
+
+    db, writer = asyncio.run(scenario())
+    assert db.activities() == [(1, "Looking left", True)]
+    assert db.summary == {(1, "Looking left"): 1}
+    assert writer.row_ids == {}
+    assert not os.path.exists(activity_writer.FALLBACK_PATH)
+
+
+def test_outage_spills_to_the_fallback_file_and_replays_in_order(paths):
+    async def scenario():
+        db = FakeDatabase()
+        writer = ActivityWriter(db)
+        db.down = True
+        await writer._flush(rows_for(writer, event("open", "a"), event("open", "b", activity="Mouth open")))
+        await writer._flush(rows_for(writer, event("close", "a")))
+        await settle(writer)
+        assert writer.backlog
+        assert [row["key"] for row in read_lines(activity_writer.FALLBACK_PATH)] == ["a", "b", "a"]
+        assert db.rows == {}
+
+        # Still down at the first replay: the rows stay on disk
+        await replay_now(writer)
+        assert writer.backlog
+        assert len(read_lines(activity_writer.CLAIMED_PATH)) == 3
+
+        # Back up: the backlog is written before the new rows, so the close finds its open
+        db.down = False
+        await replay_now(writer, rows_for(writer, event("close", "b", activity="Mouth open")))
+        await writer.stop()
+        return db, writer
+
+    db, writer = asyncio.run(scenario())
+    assert not writer.backlog
+    assert sorted(db.activities()) == [(1, "Looking left", True), (1, "Mouth open", True)]
+    assert db.summary == {(1, "Looking left"): 1, (1, "Mouth open"): 1}
+    assert not os.path.exists(activity_writer.FALLBACK_PATH)
+    assert not os.path.exists(activity_writer.CLAIMED_PATH)
+
+
+def test_rows_spilled_during_a_replay_are_kept_for_the_next_one(paths):
+    async def scenario():
+        db = FakeDatabase()
+        writer = ActivityWriter(db)
+        db.down = True
+        await writer._flush(rows_for(writer, event("open", "a")))
+        await settle(writer)
+
+        # A row spilled while the claimed file is being replayed goes to a new fallback file
+        original = writer._replay_rows
+
+        async def replay_rows(rows):
+            writer._replay_rows = original
+            writer._spill(rows_for(writer, event("open", "b", activity="Mouth open")))
+            return await original(rows)
+
+        writer._replay_rows = replay_rows
+        db.down = False
+        await replay_now(writer)
+        await writer.stop()
+        return db
+
+    db = asyncio.run(scenario())
+    assert sorted(db.activities()) == [(1, "Looking left", False), (1, "Mouth open", False)]
+
+
+def test_rejected_rows_are_quarantined_after_max_attempts(paths):
+    async def scenario():
+        db = FakeDatabase()
+        writer = ActivityWriter(db)
+        db.down = True
+        await writer._flush(rows_for(writer, event("open", "bad"), user_id=13))
+        await writer._flush(rows_for(writer, event("open", "good")))
+        await settle(writer)
+
+        db.down = False
+        db.rejected.add(13)
+        # The good row is written at the first replay, the bad one is retried until quarantined
+        await replay_now(writer)
+        assert db.activities() == [(1, "Looking left", False)]
+        for _ in range(MAX_REPLAY_ATTEMPTS - 1):
+            assert writer.backlog
+            await replay_now(writer)
+        await writer.stop()
+        return db, writer
+
+    db, writer = asyncio.run(scenario())
+    assert not writer.backlog
+    assert db.activities() == [(1, "Looking left", False)]
+    assert db.summary == {(1, "Looking left"): 1}
+    quarantined = read_lines(activity_writer.QUARANTINE_PATH)
+    assert [(row["user_id"], row["attempts"]) for row in quarantined] == [(13, MAX_REPLAY_ATTEMPTS)]
+    assert not os.path.exists(activity_writer.CLAIMED_PATH)
+
+
+def test_rows_committed_before_a_cancel_are_not_spilled(paths):
+    async def scenario():
+        db = FakeDatabase()
+        writer = ActivityWriter(db, flush_interval=0)
+        # Cancelled while the connection goes back to the pool, after the commit
+        db.error_on_release = asyncio.CancelledError()
+        writer.start()
+        writer.add(1, event("open", "a"))
+        with pytest.raises(asyncio.CancelledError):
+            await writer._task
+        writer._task = None
+        await writer.stop()
+        return db
+
+    db = asyncio.run(scenario())
+    assert db.commits == 1
+    assert db.activities() == [(1, "Looking left", False)]
+    assert read_lines(activity_writer.FALLBACK_PATH) == []
+
+
+def test_rows_committed_before_an_error_are_not_spilled(paths):
+    async def scenario():
+        db = FakeDatabase()
+        writer = ActivityWriter(db)
+        db.error_on_release = psycopg.OperationalError("connection lost")
+        await writer._flush(rows_for(writer, event("open", "a")))
+        await writer.stop()
+        return db, writer
+
+    db, writer = asyncio.run(scenario())
+    assert not writer.backlog
+    assert db.summary == {(1, "Looking left"): 1}
+    assert read_lines(activity_writer.FALLBACK_PATH) == []
+
+
+def test_pending_fallback_file_is_replayed_after_a_restart(paths):
+    async def scenario():
+        db = FakeDatabase()
+        db.down = True
+        writer = ActivityWriter(db)
+        await writer._flush(rows_for(writer, event("open", "a")))
+        await writer.stop()
+
+        db.down = False
+        restarted = ActivityWriter(db)
+        assert restarted.backlog
+        await replay_now(restarted, rows_for(restarted, event("close", "a")))
+        await restarted.stop()
+        return db
+
+    db = asyncio.run(scenario())
+    assert db.activities() == [(1, "Looking left", True)]
+    assert not os.path.exists(activity_writer.FALLBACK_PATH)
+
+
+def test_close_of_an_interval_opened_before_a_restart_is_matched_on_its_start(paths):
+    async def scenario():
+        db = FakeDatabase()
+        writer = ActivityWriter(db)
+        await writer._flush(rows_for(writer, event("open", "a")))
+        await writer.stop()
+
+        # The row ids of the open intervals are lost with the process
+        restarted = ActivityWriter(db)
+        await restarted._flush(rows_for(restarted, event("close", "a")))
+        await restarted.stop()
+        return db
+
+    db = asyncio.run(scenario())
+    assert db.activities() == [(1, "Looking left", True)]
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from event_compactor import EventCompactor, MIN_DURATION, RELEASE_TIME
+
+T0 = datetime(2024, 5, 1, 9, 0, 0)
+
+
+def at(seconds):
+    return T0 + timedelta(seconds=seconds)
+
+
+def feed(compactor, frames):
+    """Feed (seconds, observations) frames, returns all the events"""
+    events = []
+    for seconds, observations in frames:
+        events += compactor.update(observations, now=at(seconds))
+    return events
+
+
+def test_opens_only_after_min_duration():
+    compactor = EventCompactor()
+    assert compactor.update({"Looking left": 1.0}, now=at(0)) == []
+    assert compactor.update({"Looking left": 1.0}, now=at(MIN_DURATION / 2)) == []
+
+    events = compactor.update({"Looking left": 0.8}, now=at(MIN_DURATION))
+    assert [(event["state"], event["activity"]) for event in events] == [("open", "Looking left")]
+    assert events[0]["start"] == at(0)
+    assert events[0]["end"] is None
+
+
+def test_flicker_shorter_than_min_duration_produces_no_event():
+    compactor = EventCompactor()
+    frames = [(0, {"Looking left": 1.0}), (0.5, {}), (0.5 + RELEASE_TIME, {}), (10, {})]
+    assert feed(compactor, frames) == []
+    assert compactor.candidates == {} and compactor.open == {}
+
+
+def test_closes_only_after_release_time():
+    compactor = EventCompactor()
+    feed(compactor, [(0, {"Looking left": 0.6}), (1, {"Looking left": 0.9}), (2, {"Looking left": 0.7})])
+
+    # Missing for less than RELEASE_TIME: still open
+    assert compactor.update({}, now=at(2 + RELEASE_TIME / 2)) == []
+    assert "Looking left" in compactor.open
+
+    events = compactor.update({}, now=at(2 + RELEASE_TIME))
+    assert len(events) == 1
+    close = events[0]
+    assert close["state"] == "close"
+    assert close["start"] == at(0)
+    # The interval ends when the activity was last seen, not when it was released
+    assert close["end"] == at(2)
+    assert close["confidence"] == 0.9
+    assert compactor.open == {}
+
+
+def test_short_gap_keeps_one_interval():
+    compactor = EventCompactor()
+    frames = [
+        (0, {"Looking left": 1.0}), (1, {"Looking left": 1.0}),
+        (1.5, {}),
+        (2, {"Looking left": 1.0}),
+        (2 + RELEASE_TIME, {}),
+    ]
+    events = feed(compactor, frames)
+    assert [event["state"] for event in events] == ["open", "close"]
+    assert events[0]["key"] == events[1]["key"]
+
+
+def test_reopened_activity_gets_a_new_key():
+    compactor = EventCompactor()
+    first = feed(compactor, [(0, {"Mouth open": 1.0}), (1, {"Mouth open": 1.0}), (1 + RELEASE_TIME, {})])
+    second = feed(compactor, [(10, {"Mouth open": 1.0}), (11, {"Mouth open": 1.0}), (11 + RELEASE_TIME, {})])
+    assert first[0]["key"] == first[1]["key"]
+    assert second[0]["key"] == second[1]["key"]
+    assert first[0]["key"] != second[0]["key"]
+
+
+def test_close_all_closes_open_intervals_and_drops_candidates():
+    compactor = EventCompactor()
+    feed(compactor, [(0, {"Looking left": 1.0, "Mouth open": 1.0}), (1, {"Looking left": 1.0})])
+    assert "Mouth open" in compactor.candidates
+
+    events = compactor.close_all()
+    assert [(event["state"], event["activity"], event["end"]) for event in events] == [
+        ("close", "Looking left", at(1)),
+    ]
+    assert compactor.open == {} and compactor.candidates == {}
@@ -3,52 +3,170 @@ from aiortc.mediastreams import MediaStreamError
 import av
 import numpy as np
 import cv2
-from datetime import datetime
 import asyncio
-import psycopg
+import os
+import time
 
-from ml_models import detect_faces, estimate_head_pose
+from ml_models import FaceTracker, classify_frame
+from ml_models.object_detector import PROHIBITED_OBJECTS
+from analysis_scheduler import AnalysisScheduler
+from event_compactor import EventCompactor
 from logger import log
 
 av.logging.set_level(av.logging.ERROR)
 
-# Frame processing settings
-FRAME_SKIP = 5
+# Faces are looked for in every ANALYSIS_DECIMATION-th pixel of every ANALYSIS_DECIMATION-th row
+DECIMATION = int(os.environ.get("ANALYSIS_DECIMATION", 1))
+# Pixel formats whose first plane is the luma, i.e. already a grayscale image
+LUMA_FORMATS = {"yuv420p", "yuvj420p", "yuv422p", "yuvj422p", "yuv444p", "yuvj444p", "nv12", "nv21"}
+# Object detection also runs on frames with another activity once its last verdict is this old, in seconds;
+# shorter than the compactor's release time so an object still in view never looks absent
+OBJECT_DETECTION_INTERVAL = float(os.environ.get("OBJECT_DETECTION_INTERVAL", 1.0))
 
 
 class VideoTransformTrack(MediaStreamTrack):
     kind = "video"
 
-    def __init__(self, track, socket_id, app):
+    def __init__(self, track, socket_id, app, student_id):
         super().__init__()
         self.app = app
         self.track = track
         self.socket_id = socket_id
+        self.student_id = student_id
         self.frame_count = 0
-        self.last_suspicious_activity = None
+        self.dropped_frames = 0
+        self.analysis_task = None
+        # Analysis processes sharded by student, None when the analysis runs on the inference threads
+        self.workers = app.get("analysis_workers")
+        self.scheduler = AnalysisScheduler(socket_id, self.id, self.workers or app["inference"])
+        if self.workers is not None:
+            self.workers.open_student(student_id)
+        self.face_tracker = FaceTracker()
+        self.compactor = EventCompactor()
         self.on_suspicious_activity = None
+        # Grayscale frame reused across frames, one analysis runs at a time per track
+        self.gray_buffer = None
+        # Last prohibited object confidence and when it was detected; object detection runs on frames
+        # without another activity, and on any frame once the verdict is OBJECT_DETECTION_INTERVAL old
+        self.object_confidence = None
+        self.object_detected_at = None
 
     async def recv(self):
-        # print(f"recv frame to check suspicious activity")
+        # Read exactly one frame and pass it through unchanged
+        frame = await self.track.recv()
         self.frame_count += 1
-        if self.frame_count % FRAME_SKIP != 0:
-            return await self.track.recv()
 
+        # Latest frame wins: a frame is analysed only when the previous analysis is done,
+        # frames arriving meanwhile are not queued so the analysis never lags behind
+        if self.analysis_task is not None and not self.analysis_task.done():
+            self.dropped_frames += 1
+        elif self.scheduler.should_analyse():
+            self.analysis_task = asyncio.create_task(self._analyse(frame))
+
+        return frame
+
+    def stop(self):
+        super().stop()
+        self.scheduler.close()
+        if self.analysis_task is not None:
+            self.analysis_task.cancel()
+        if self.workers is not None:
+            self.workers.close_student(self.student_id)
+        # Close the intervals still open when the stream ends
+        for event in self.compactor.close_all():
+            asyncio.ensure_future(self._log_activity_event(event))
+
+    async def _analyse(self, frame):
         try:
-            frame = await self.track.recv()
-            img = self._convert_frame_to_ndarray(frame)
+            if self.workers is not None:
+                # Converted on the inference executor, analysed by the process that owns this student
+                gray = await self.app["inference"].run(self._convert_frame_to_gray, frame)
+                activity = await self._analyse_in_worker(gray) if gray is not None else None
+            else:
+                # Run the analysis on the inference executor so the event loop keeps serving other peers
+                gray, activity = await self.app["inference"].run(self._analyse_frame, frame)
+            # log.info(f"Processed frame - Activity detected: {activity}")
+            observations = {activity: 1.0} if activity else {}
+            now = time.monotonic()
+            stale = self.object_detected_at is None or now - self.object_detected_at >= OBJECT_DETECTION_INTERVAL
+            if gray is not None and (activity is None or stale):
+                self.object_confidence = await self._detect_objects(frame)
+                self.object_detected_at = now
+            elif stale:
+                # No detection behind the last verdict anymore, the object is not reported
+                self.object_confidence = None
+            # Until object detection runs again the object is assumed to still be there (or not)
+            if self.object_confidence:
+                observations["Prohibited object"] = self.object_confidence
+
+            # Only the opening and closing of activity intervals are logged
+            for event in self.compactor.update(observations):
+                if event["state"] == "open":
+                    # Look closer at this student for a while after a new suspicious event
+                    self.scheduler.boost()
+                await self._log_activity_event(event)
+        except Exception as e:
+            log.error(f"Error processing frame: {e}")
+
+    async def _analyse_in_worker(self, gray):
+        try:
+            return await self.workers.analyse(self.student_id, gray, DECIMATION)
+        except Exception as e:
+            # e.g. while a crashed analysis process is restarted
+            log.error(f"Analysis process unavailable, analysing on the inference executor: {e}")
+            return await self.app["inference"].run(self._process_frame, gray)
+
+    def _analyse_frame(self, frame):
+        gray = self._convert_frame_to_gray(frame)
+        if gray is None:
+            return None, None
+        return gray, self._process_frame(gray)
+
+    async def _detect_objects(self, frame):
+        batcher = self.app.get("object_batcher")
+        if batcher is None:
+            return None
+        try:
+            # YOLO needs colour, the only place the frame is converted to BGR
+            img = await self.app["inference"].run(self._convert_frame_to_ndarray, frame)
             if img is None:
-                return await self.track.recv()
+                return None
+            # Batched with the frames of the other students
+            objects = await batcher.detect(img)
+            log.info(f"Object detection - Objects: {objects}")
+            # Highest confidence among the prohibited objects, if any
+            return max((confidence for label, confidence in objects if label in PROHIBITED_OBJECTS), default=None)
+        except Exception as e:
+            log.error(f"Error detecting objects: {e}")
+            return None
 
-            last_suspicious_activity = self._process_frame(img)
-            # log.info(f"Processed frame - Activity detected: {last_suspicious_activity}")
-            await self._log_suspicious_activity(last_suspicious_activity)
+    def _convert_frame_to_gray(self, frame):
+        """Luma plane of the decoded frame as a grayscale image, without a YUV to BGR conversion"""
+        try:
+            if frame.format.name in LUMA_FORMATS:
+                plane = frame.planes[0]
+                # Rows are padded to line_size bytes, the view drops the padding without copying
+                luma = np.frombuffer(plane, np.uint8, count=plane.line_size * plane.height)
+                luma = luma.reshape(plane.height, plane.line_size)[:, :plane.width]
+            else:
+                luma = frame.to_ndarray(format="gray")
+            if DECIMATION > 1:
+                luma = luma[::DECIMATION, ::DECIMATION]
 
-            return await self.track.recv()
+            if luma.size == 0:
+                log.error("Invalid frame dimensions")
+                return None
 
+            if luma.flags["C_CONTIGUOUS"]:
+                return luma
+            # dlib needs a contiguous image, copy into the buffer kept from the previous frame
+            if self.gray_buffer is None or self.gray_buffer.shape != luma.shape:
+                self.gray_buffer = np.empty(luma.shape, dtype=np.uint8)
+            np.copyto(self.gray_buffer, luma)
+            return self.gray_buffer
         except Exception as e:
-            log.error(f"Error processing frame: {e}")
-            return await self.track.recv()
+            log.error(f"Error converting frame: {e}")
+            return None
 
     def _convert_frame_to_ndarray(self, frame):
         try:
@@ -75,60 +193,30 @@ class VideoTransformTrack(MediaStreamTrack):
             return None
 
     def _process_frame(self, img):
-        try:
-            face_count, faces = detect_faces(img)
-            log.info(f"Face detection - Count: {face_count}")
-            if face_count == 1:
-                activity = self._estimate_head_pose(faces[0], img)
-                log.info(f"Head pose estimation - Activity: {activity}")
-                return activity
-            elif face_count > 1:
-                log.info("Multiple faces detected")
-                return "Multiple faces"
-            else:
-                log.info("No face detected")
-                return "No face"
-        except Exception as e:
-            log.error(f"Error processing frame: {e}")
-            return None
+        # The face rectangles are in decimated coordinates
+        return classify_frame(self.face_tracker, img, DECIMATION)
 
-    def _estimate_head_pose(self, face, img):
+    async def _log_activity_event(self, event):
+        activity = event["activity"]
         try:
-            head_pos = estimate_head_pose([face], img)
-            log.info(f"Head position: {head_pos}")
-            if head_pos != "center":
-                return "Looking away"
-            return None
+            # Queued for the write-behind activity writer, the database is never awaited here
+            log.info(f"Logging suspicious activity {event['state']}: {activity}")
+            self.app["activity_writer"].add(self.student_id, event)
+
+            # Emit socket event
+            activity_data = {
+                "state": event["state"],
+                "activity": activity,
+                "timestamp": event["start"].isoformat(),
+                "end": event["end"].isoformat() if event["end"] else None,
+                "confidence": event["confidence"],
+                "id": int(event["start"].timestamp())
+            }
+            log.info(f"Preparing to emit suspicious activity: {activity_data}")
+            if self.on_suspicious_activity:
+                log.info("Calling on_suspicious_activity callback")
+                await self.on_suspicious_activity(activity_data)
+            else:
+                log.warning("No on_suspicious_activity callback set")
         except Exception as e:
-            log.error(f"Error estimating head pose: {e}")
-            return None
-
-    async def _log_suspicious_activity(self, activity):
-        if activity and activity != self.last_suspicious_activity:
-            try:
-                # Log to database
-                db = self.app["db"]
-                async with db.cursor(row_factory=psycopg.rows.dict_row) as cur:
-                    log.info(f"Logging suspicious activity to database: {activity}")
-                    await cur.execute(
-                        "INSERT INTO user_suspicious_activities (user_id, activity) VALUES (%s, %s)",
-                        (1, activity),
-                    )
-                    await db.commit()
-
-                # Emit socket event
-                activity_data = {
-                    "activity": activity,
-                    "timestamp": datetime.now().isoformat(),
-                    "id": int(datetime.now().timestamp())
-                }
-                log.info(f"Preparing to emit suspicious activity: {activity_data}")
-                if self.on_suspicious_activity:
-                    log.info("Calling on_suspicious_activity callback")
-                    await self.on_suspicious_activity(activity_data)
-                else:
-                    log.warning("No on_suspicious_activity callback set")
-
-                self.last_suspicious_activity = activity
-            except Exception as e:
-                log.error(f"Error logging suspicious activity: {e}")
+            log.error(f"Error logging suspicious activity: {e}")
@@ -4,6 +4,7 @@ import re
 from socket_server import socket
 from logger import log
 from video_transform_track import VideoTransformTrack
+from session_registry import SessionRegistry
 import asyncio
 from aiortc.exceptions import InvalidStateError
 from contextlib import suppress
@@ -12,30 +13,41 @@ from contextlib import suppress
 app = web.Application()
 socket.attach(app)
 
-# Store peer connections for both students and admins
-students_peer = set()
-admin_peer = set()
-# Store admin socket IDs for each student
-student_admin_map = {}
+# Peer connections of the students and the admins watching them, indexed by socket and student
+sessions = SessionRegistry()
+app["sessions"] = sessions
 # Store cleanup tasks to prevent race conditions
 cleanup_tasks = {}
 
+# The schema has no exams yet, students that do not send an examId share this one
+DEFAULT_EXAM = "default"
+
 # Define STUN servers
 ice_config = RTCConfiguration([
     RTCIceServer(urls=["stun:stun.l.google.com:19302"])
 ])
 
+def student_room(student_id):
+    """Sockets of the student itself"""
+    return f"student:{student_id}"
+
+def watchers_room(student_id):
+    """Sockets of the invigilators watching one student"""
+    return f"watchers:{student_id}"
+
+def exam_watchers_room(exam_id):
+    """Sockets of the invigilators watching a whole exam"""
+    return f"exam:{exam_id}:watchers"
+
+def signalling_rooms(student_id, exam_id=DEFAULT_EXAM):
+    """Rooms of everyone taking part in a student's negotiation"""
+    return [student_room(student_id), watchers_room(student_id), exam_watchers_room(exam_id)]
+
 async def safe_cleanup(pc, student_id=None):
     """Safely cleanup a peer connection with proper error handling"""
     try:
-        if pc in students_peer:
+        if sessions.remove_peer(pc):
             log.info(f"Removing peer connection for student {student_id}")
-            students_peer.discard(pc)
-            
-            # Remove admin mapping if this was the last connection for the student
-            if student_id and not any(p.student_id == student_id for p in students_peer):
-                if student_id in student_admin_map:
-                    del student_admin_map[student_id]
         
         # Close all transceivers first
         for transceiver in pc.getTransceivers():
@@ -88,12 +100,17 @@ async def offer(sid, data):
             }, to=sid)
             return
         
+        # Admin offers and the answers and candidates of watchers are delivered to this room
+        exam_id = data.get('examId', DEFAULT_EXAM)
+        await socket.enter_room(sid, student_room(student_id))
+
         # Create a peer connection for video analysis
         pc = RTCPeerConnection(ice_config)
         pc.student_id = student_id
+        pc.exam_id = exam_id
         pc.socket_id = sid
         pc.is_analysis = True  # Mark this as analysis connection
-        students_peer.add(pc)
+        sessions.add_peer(pc)
 
         @pc.on("track")
         async def on_track(track):
@@ -102,20 +119,16 @@ async def offer(sid, data):
                 log.info(f"Received video track from student {student_id}")
                 try:
                     # Create a video transform track for analysis
-                    video_transform = VideoTransformTrack(track, sid, app)
+                    video_transform = VideoTransformTrack(track, sid, app, student_id)
                     
                     # Set up the callback for suspicious activity
                     async def notify_admin(activity_data):
                         log.info(f"Suspicious activity detected for student {student_id}: {activity_data}")
-                        admin_sid = student_admin_map.get(student_id)
-                        if admin_sid:
-                            log.info(f"Sending suspicious activity notification to admin {admin_sid}")
-                            await socket.emit("suspicious_activity", {
-                                "studentId": student_id,
-                                "activity": activity_data["activity"],
-                                "timestamp": activity_data["timestamp"],
-                                "id": activity_data["id"]
-                            }, to=admin_sid)
+                        admin_sids = sessions.subscribers(student_id, pc.exam_id)
+                        if admin_sids:
+                            log.info(f"Sending suspicious activity notification to {len(admin_sids)} admins")
+                            # Batched and sent to every admin watching the student or its exam
+                            app["activity_notifier"].publish(admin_sids, student_id, activity_data)
                         else:
                             log.warning(f"No admin found for student {student_id}")
                     
@@ -136,6 +149,8 @@ async def offer(sid, data):
                         except Exception as e:
                             log.error(f"Error receiving frame: {e}")
                             break
+                    # Stop the pending analysis and release the stream's scheduler
+                    video_transform.stop()
                 except Exception as e:
                     log.error(f"Error setting up video transform track: {e}")
 
@@ -144,14 +159,14 @@ async def offer(sid, data):
             log.info(f"Student {student_id} ICE connection state changed to {pc.iceConnectionState}")
             if pc.iceConnectionState == "failed":
                 await pc.close()
-                students_peer.discard(pc)
+                sessions.remove_peer(pc)
 
         @pc.on("connectionstatechange")
         async def on_connectionstatechange():
             log.info(f"Student {student_id} connection state changed to {pc.connectionState}")
             if pc.connectionState == "failed":
                 await pc.close()
-                students_peer.discard(pc)
+                sessions.remove_peer(pc)
 
         # Set up the peer connection for analysis
         offer = RTCSessionDescription(sdp=data["sdp"], type=data["type"])
@@ -167,18 +182,18 @@ async def offer(sid, data):
             "isAnalysis": True  # Mark this as analysis answer
         }, to=sid)
 
-        # Forward the original offer to other clients (for direct browser-to-browser)
+        # Forward the original offer to the invigilators watching (for direct browser-to-browser)
         await socket.emit("offer", {
             "sdp": data["sdp"],
             "type": data["type"],
             "studentId": student_id
-        }, skip_sid=sid)
+        }, to=[watchers_room(student_id), exam_watchers_room(exam_id)])
 
     except Exception as e:
         log.error(f"Error handling offer: {e}")
         if 'pc' in locals():
             await pc.close()
-            students_peer.discard(pc)
+            sessions.remove_peer(pc)
 
 @socket.event
 async def admin_offer(sid, data):
@@ -191,7 +206,8 @@ async def admin_offer(sid, data):
         log.info(f"Admin {sid} requesting video from student {student_id}")
         
         # Store the admin's socket ID for this student
-        student_admin_map[student_id] = sid
+        sessions.add_admin(student_id, sid)
+        await socket.enter_room(sid, watchers_room(student_id))
         
         # Forward the offer to the student with isAdminOffer flag
         log.info(f"Forwarding admin offer to student")
@@ -202,11 +218,19 @@ async def admin_offer(sid, data):
             "isAdminOffer": True,
             "adminId": sid,
             "fromAdmin": True
-        }, skip_sid=sid)
+        }, to=student_room(student_id))
 
     except Exception as e:
         log.error(f"Error handling admin offer: {e}")
 
+@socket.event
+async def watch_exam(sid, data):
+    """An invigilator joins the offers and suspicious activities of every student of an exam"""
+    exam_id = data.get('examId', DEFAULT_EXAM)
+    log.info(f"Admin {sid} watching exam {exam_id}")
+    sessions.watch_exam(exam_id, sid)
+    await socket.enter_room(sid, exam_watchers_room(exam_id))
+
 @socket.event
 async def answer(sid, data):
     try:
@@ -236,12 +260,12 @@ async def answer(sid, data):
             log.info(f"Received analysis answer from {sid}")
             # No need to forward this answer
         else:
-            # Otherwise, forward to all other clients
+            # Otherwise, forward to the other peers of this student's negotiation
             await socket.emit("answer", {
                 "sdp": data["sdp"],
                 "type": data["type"],
                 "studentId": student_id
-            }, skip_sid=sid)
+            }, to=signalling_rooms(student_id, data.get('examId', DEFAULT_EXAM)), skip_sid=sid)
         log.info(f"Forwarded answer from {sid}")
 
     except Exception as e:
@@ -270,13 +294,13 @@ async def candidate(sid, data):
             log.info(f"Received analysis candidate from {sid}")
             # No need to forward this candidate
         else:
-            # Otherwise, forward to all other clients
+            # Otherwise, forward to the other peers of this student's negotiation
             await socket.emit("candidate", {
                 "candidate": data.get("candidate"),
                 "sdpMid": data.get("sdpMid"),
                 "sdpMLineIndex": data.get("sdpMLineIndex"),
                 "studentId": student_id
-            }, skip_sid=sid)
+            }, to=signalling_rooms(student_id, data.get('examId', DEFAULT_EXAM)), skip_sid=sid)
         log.info(f"Forwarded ICE candidate from {sid}")
 
     except Exception as e:
@@ -286,18 +310,15 @@ async def candidate(sid, data):
 async def disconnect(sid):
     log.warning(f"Client disconnected: {sid}")
     # Clean up any peer connections for this socket ID
-    for pc in students_peer.copy():
-        if hasattr(pc, 'socket_id') and pc.socket_id == sid:
-            student_id = getattr(pc, 'student_id', None)
-            if student_id in cleanup_tasks:
-                cleanup_tasks[student_id].cancel()
-                del cleanup_tasks[student_id]
-            await safe_cleanup(pc, student_id)
+    for pc in sessions.peers_for_sid(sid):
+        student_id = pc.student_id
+        if student_id in cleanup_tasks:
+            cleanup_tasks[student_id].cancel()
+            del cleanup_tasks[student_id]
+        await safe_cleanup(pc, student_id)
     
     # Remove admin mapping if this was an admin
-    for student_id, admin_sid in list(student_admin_map.items()):
-        if admin_sid == sid:
-            del student_admin_map[student_id]
+    sessions.remove_admin_sid(sid)
 
 def parse_candidate(candidate_str):
     """Parse a candidate string into RTCIceCandidate parameters"""
@@ -1,21 +1,24 @@
 import cv2
 import imutils
-import time
-from facial_detections import detectFace
+from facial_detections import analyseFrame
+from face_tracking import FaceTracker
 from blink_detection import isBlinking
 from mouth_tracking import mouthTrack
-from object_detection import detectObject
+from object_detection import detectObject, suspiciousClasses
 from eye_tracker import gazeDetection
-from head_pose_estimation import head_pose_detection 
-import winsound
+from head_pose_estimation import head_pose_detection
+from alert_dispatcher import AlertDispatcher
+from video_capture import FrameGrabber, printLatency
+import time
+from activity_log import ActivityLog
 from datetime import datetime
 
-global data_record
-data_record = []
+#State changes are streamed to activity.jsonl instead of being kept in memory
+activityLog = ActivityLog()
 
-#For Beeping
-frequency = 2500
-duration = 1000
+#Beeps are played by the alert dispatcher thread so the loop never stalls
+alerts = AlertDispatcher()
+alerts.start()
 
 #OpenCV videocapture for the webcam
 cam = cv2.VideoCapture(0)
@@ -27,13 +30,11 @@ if (cam.isOpened() == False):
 #Face Count If-else conditions
 def faceCount_detection(faceCount):
     if faceCount > 1:
-        time.sleep(5)
         remark = "Multiple faces has been detected."
-        winsound.Beep(frequency, duration)
+        alerts.alert('faceCount', remark)
     elif faceCount == 0:
         remark = "No face has been detected."
-        time.sleep(3)
-        winsound.Beep(frequency, duration)
+        alerts.alert('faceCount', remark)
     else:
         remark = "Face detecting properly."
     return remark
@@ -43,83 +44,95 @@ def faceCount_detection(faceCount):
 def proctoringAlgo():
 
     blinkCount = 0
+    faceTracker = FaceTracker()
 
-    while True:
-        ret, frame = cam.read()
-        # frame = imutils.resize(frame, width=450)
-
-        record = []
-
-        #Reading the Current time
-        current_time = datetime.now().strftime("%H:%M:%S.%f")
-        print("Current Time is:", current_time)
-        record.append(current_time)
-
-        #Returns the face count and will detect the face.
-        faceCount, faces = detectFace(frame)
-        print(faceCount_detection(faceCount))
-        record.append(faceCount_detection(faceCount))
-        # print(faceCount)
-
-        if faceCount == 1:
-
-            #Blink Detection
-            blinkStatus = isBlinking(faces, frame)
-            print(blinkStatus[2])
-
-            if blinkStatus[2] == "Blink":
-                blinkCount += 1
-                record.append(blinkStatus[2] + " count: " + str(blinkCount))
-            else:
-                record.append(blinkStatus[2])
+    #The capture thread keeps the newest frames, the loop always analyses the latest one
+    grabber = FrameGrabber(cam)
+    grabber.start()
+    frameId = 0
 
-
-            # Gaze Detection
-            eyeStatus = (gazeDetection(faces, frame))
-            print(eyeStatus)
-            record.append(eyeStatus)
-
-            #Mouth Position Detection
-            print(mouthTrack(faces, frame))
-            record.append(mouthTrack(faces, frame))
-
-            #Object detection using YOLO
-            objectName = detectObject(frame)
-            print(objectName)
-            record.append(objectName)
-
-            if len(objectName) > 1:
-                time.sleep(4)
-                winsound.Beep(frequency, duration)
+    try:
+        while True:
+            latest = grabber.latest(frameId)
+            if latest is None:
                 continue
-
-            # Head Pose estimation
-            print(head_pose_detection(faces, frame))
-            record.append(head_pose_detection(faces, frame))
+            frameId, captureTime, frame = latest
+            analysisStart = time.time()
+            # frame = imutils.resize(frame, width=450)
+
+            record = {}
+
+            #Capture time of the frame
+            current_time = datetime.fromtimestamp(captureTime).strftime("%H:%M:%S.%f")
+            print("Current Time is:", current_time)
+
+            #Detects the faces and computes their landmarks once, shared by every detector below
+            context = analyseFrame(frame, faceTracker)
+            faceCount, faces, landmarks = context.faceCount, context.faces, context.landmarks
+            remark = faceCount_detection(faceCount)
+            print(remark)
+            record['face'] = remark
+            # print(faceCount)
+
+            if faceCount == 1:
+
+                #Blink Detection
+                blinkStatus = isBlinking(faces, frame, landmarks)
+                print(blinkStatus[2])
+
+                if blinkStatus[2] == "Blink":
+                    blinkCount += 1
+                record['blink'] = blinkStatus[2]
+                record['blinkCount'] = blinkCount
+
+
+                # Gaze Detection
+                eyeStatus = gazeDetection(faces, frame, landmarks)
+                print(eyeStatus)
+                record['gaze'] = eyeStatus
+
+                #Mouth Position Detection
+                mouthStatus = mouthTrack(faces, frame, landmarks)
+                print(mouthStatus)
+                record['mouth'] = mouthStatus
+
+                #Object detection using YOLO
+                objectName = detectObject(frame, suspiciousClasses)
+                print(objectName)
+                record['objects'] = sorted({label for label, confidence in objectName})
+
+                if len(objectName) > 1:
+                    alerts.alert('object', "Suspicious object has been detected.")
+
+                # Head Pose estimation
+                headStatus = head_pose_detection(faces, frame, landmarks)
+                print(headStatus)
+                record['headPose'] = headStatus
         
-        else:
-            data_record.append(record)
-            continue
+            else:
+                printLatency(captureTime, analysisStart)
+                activityLog.record(datetime.fromtimestamp(captureTime).isoformat(), record)
+                continue
 
-        data_record.append(record)
-        # eyeStatus = gazeDetection(faces, frame)
-        # print(eyeStatus)
-        # print(objectName) 
+            printLatency(captureTime, analysisStart)
+            activityLog.record(datetime.fromtimestamp(captureTime).isoformat(), record)
+            # eyeStatus = gazeDetection(faces, frame)
+            # print(eyeStatus)
+            # print(objectName) 
 
-        cv2.imshow('Frame', frame)
+            cv2.imshow('Frame', frame)
 
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-    
-    cam.release()
-    cv2.destroyAllWindows()
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        #Also runs when a detector raises, so the capture thread never outlives the loop
+        grabber.stop()
+        grabber.join()
+        cam.release()
+        cv2.destroyAllWindows()
 
 if __name__ == '__main__':
     proctoringAlgo()
 
-    # Convert the list to a string with each element on a new line
-    activityVal = "\n".join(map(str, data_record))
-    # print(activityVal)
-
-    with open('activity.txt', 'w') as file:
-        file.write(str(activityVal))
+    # Write the buffered state changes to activity.jsonl and close the log
+    activityLog.close()
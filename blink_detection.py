@@ -1,17 +1,15 @@
 
-import dlib
 from math import hypot
 import cv2
-
-shapePredictorModel  = 'shape_predictor_model/shape_predictor_68_face_landmarks.dat'
-shapePredictor = dlib.shape_predictor(shapePredictorModel)
+from imutils import face_utils
+import model_registry
 
 
 def midPoint(pointA, pointB):
 
     #Calculate the mid point of A and B
-    X = int(pointA.x + pointB.x)/2
-    Y = int(pointA.y + pointB.y)/2
+    X = int(pointA[0] + pointB[0])/2
+    Y = int(pointA[1] + pointB[1])/2
 
     return (X,Y)
 
@@ -23,7 +21,7 @@ def findDist(pointA, pointB):
     return dist
 
 
-def isBlinking(faces, frame):
+def isBlinking(faces, frame, landmarks=None):
 
     font  = cv2.FONT_HERSHEY_PLAIN
     ratio = ()
@@ -34,26 +32,29 @@ def isBlinking(faces, frame):
     right = [42,43,44,45,46,47]
 
 
-    for face in faces:
-        facialLandmarks = shapePredictor(frame, face)
+    #landmarks computed once per frame by facial_detections.analyseFrame can be passed in
+    if landmarks is None:
+        landmarks = [face_utils.shape_to_np(model_registry.shapePredictor()(frame, face)) for face in faces]
+
+    for facialLandmarks in landmarks:
 
         #left eye markings
-        lLeftPoint = (facialLandmarks.part(36).x, facialLandmarks.part(36).y)
-        lRightPoint = (facialLandmarks.part(39).x, facialLandmarks.part(39).y)
+        lLeftPoint = facialLandmarks[36]
+        lRightPoint = facialLandmarks[39]
 
-        lTopPoint = midPoint(facialLandmarks.part(37), facialLandmarks.part(38))
-        lBottomPoint = midPoint(facialLandmarks.part(40), facialLandmarks.part(41))
+        lTopPoint = midPoint(facialLandmarks[37], facialLandmarks[38])
+        lBottomPoint = midPoint(facialLandmarks[40], facialLandmarks[41])
 
         leftHorLen = findDist(lLeftPoint, lRightPoint)
         leftVerLen = findDist(lTopPoint, lBottomPoint)
 
 
         #right eye markings
-        rLeftPoint = (facialLandmarks.part(42).x, facialLandmarks.part(42).y)
-        rRightPoint = (facialLandmarks.part(45).x, facialLandmarks.part(45).y)
+        rLeftPoint = facialLandmarks[42]
+        rRightPoint = facialLandmarks[45]
 
-        rTopPoint = midPoint(facialLandmarks.part(43), facialLandmarks.part(44))
-        rBottomPoint = midPoint(facialLandmarks.part(46), facialLandmarks.part(47))
+        rTopPoint = midPoint(facialLandmarks[43], facialLandmarks[44])
+        rBottomPoint = midPoint(facialLandmarks[46], facialLandmarks[47])
 
         rightHorLen = findDist(rLeftPoint, rRightPoint)
         rightVerLen = findDist(rTopPoint, rBottomPoint)
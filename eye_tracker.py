@@ -1,10 +1,7 @@
-import dlib
 import cv2
 import numpy as np
-
-
-shapePredictorModel  = 'shape_predictor_model/shape_predictor_68_face_landmarks.dat'
-shapePredictor = dlib.shape_predictor(shapePredictorModel)
+from imutils import face_utils
+import model_registry
 
 
 def createMask(frame):
@@ -38,7 +35,7 @@ def eyeSegmentationAndReturnWhite(img, side):
 
 
 
-def gazeDetection(faces, frame):
+def gazeDetection(faces, frame, landmarks=None):
 
     font = cv2.FONT_HERSHEY_DUPLEX
     thickness = 2
@@ -49,11 +46,14 @@ def gazeDetection(faces, frame):
     leftEye = [36,37,38,39,40,41]
     rightEye = [42,43,44,45,46,47]
 
-    for face in faces:
-        facialLandmarks = shapePredictor(frame, face)
+    #landmarks computed once per frame by facial_detections.analyseFrame can be passed in
+    if landmarks is None:
+        landmarks = [face_utils.shape_to_np(model_registry.shapePredictor()(frame, face)) for face in faces]
+
+    for facialLandmarks in landmarks:
 
-        leftEyeRegion = np.array([(facialLandmarks.part(i).x, facialLandmarks.part(i).y) for i in leftEye], np.int32)
-        rightEyeRegion = np.array([(facialLandmarks.part(i).x, facialLandmarks.part(i).y) for i in rightEye], np.int32)
+        leftEyeRegion = facialLandmarks[leftEye].astype(np.int32)
+        rightEyeRegion = facialLandmarks[rightEye].astype(np.int32)
 
         #Now we have to track the replica of eye i.e. iris, pupil, sclera
         mask = createMask(frame)
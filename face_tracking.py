@@ -0,0 +1,60 @@
+# Detect-then-track face localisation.
+# The full HOG face detection runs every few frames only, the frames in between follow the faces
+# with one cheap dlib correlation tracker per face seeded from the last detected rectangle.
+
+import dlib
+from facial_detections import detectFaceRects
+
+
+class FaceTracker:
+
+    def __init__(self, detectEvery=10, minConfidence=7.0):
+        #Run a full detection every detectEvery frames
+        self.detectEvery = detectEvery
+
+        #Peak-to-sidelobe ratio under which a tracker is considered lost and a full detection is forced
+        self.minConfidence = minConfidence
+
+        self.trackers = []
+        self.framesSinceDetection = 0
+
+    def reset(self):
+        #Forces a full detection on the next frame
+        self.trackers = []
+        self.framesSinceDetection = 0
+
+    def _detect(self, gray):
+        faces = detectFaceRects(gray)
+
+        self.trackers = []
+        for face in faces:
+            tracker = dlib.correlation_tracker()
+            tracker.start_track(gray, face)
+            self.trackers.append(tracker)
+
+        self.framesSinceDetection = 0
+        return faces
+
+    def update(self, gray):
+        """
+        Input: 1-channel video frame
+        Output: Returns the face rectangles, detected or tracked
+        """
+        #No face to follow, or time for a periodic detection so that new faces show up quickly
+        if not self.trackers or self.framesSinceDetection >= self.detectEvery:
+            return self._detect(gray)
+
+        faces = dlib.rectangles()
+        for tracker in self.trackers:
+            confidence = tracker.update(gray)
+            if confidence < self.minConfidence:
+                #The face moved too much or left the frame
+                return self._detect(gray)
+
+            position = tracker.get_position()
+            faces.append(dlib.rectangle(
+                int(position.left()), int(position.top()), int(position.right()), int(position.bottom())
+            ))
+
+        self.framesSinceDetection += 1
+        return faces
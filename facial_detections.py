@@ -2,27 +2,107 @@
 
 import dlib
 import cv2
+import numpy as np
 from imutils import face_utils
+import model_registry
 
-shapePredictorModel  = 'shape_predictor_model/shape_predictor_68_face_landmarks.dat'
-shapePredictor = dlib.shape_predictor(shapePredictorModel)
 
+#Face detection settings, changed with configureDetection
+detectionSettings = {
+    'upsample': 0,      #number of times dlib upsamples the image (finds smaller faces, but much slower)
+    'width': None,      #width in pixels the frame is downscaled to before detection, None keeps the full size
+    'roi': None,        #region of interest (x, y, w, h) searched for faces, None searches the whole frame
+}
 
-def detectFace(frame):
+
+def configureDetection(upsample=0, width=None, roi=None):
     """
-    Input: It will receive a video frame, from the front camera
-    Output: Returns the counts of faces (detect all the faces and localize them) detected by the dlib's face detector
+    Input: dlib upsample level, detection width in pixels and region of interest (x, y, w, h)
+    Face detection cost grows with the searched area, so a smaller detection width or a region of interest
+    make it cheaper. The detected rectangles are always returned in full frame coordinates.
     """
-    #Converting 3-channel images to 1-channel image
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    detectionSettings['upsample'] = upsample
+    detectionSettings['width'] = width
+    detectionSettings['roi'] = roi
+
+
+def detectFaceRects(gray):
+    #Runs the face detector following detectionSettings and maps the rectangles back to the full frame
+    faceDetector = model_registry.faceDetector()
+    upsample = detectionSettings['upsample']
+    width = detectionSettings['width']
+    roi = detectionSettings['roi']
+
+    image = gray
+    offsetX, offsetY = 0, 0
+
+    if roi is not None:
+        x, y, w, h = roi
+        x, y = max(0, int(x)), max(0, int(y))
+        image = np.ascontiguousarray(gray[y:y + int(h), x:x + int(w)])
+        offsetX, offsetY = x, y
+
+    scale = 1.0
+    if width is not None and image.shape[1] > width:
+        scale = image.shape[1] / width
+        height = max(1, int(round(image.shape[0] / scale)))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+    faces = faceDetector(image, upsample)
+    if scale == 1.0 and offsetX == 0 and offsetY == 0:
+        return faces
+
+    mapped = dlib.rectangles()
+    for face in faces:
+        mapped.append(dlib.rectangle(
+            int(face.left() * scale) + offsetX,
+            int(face.top() * scale) + offsetY,
+            int(face.right() * scale) + offsetX,
+            int(face.bottom() * scale) + offsetY,
+        ))
+    return mapped
 
-    faceDetector = dlib.get_frontal_face_detector()
-    faces = faceDetector(gray,0)
 
-    #Count the number of the faces
-    faceCount = len(faces)
+class FrameContext:
+    """
+    Per-frame analysis state shared by every detector.
+    The grayscale image, the face rectangles and the 68-point landmarks (one numpy array per face)
+    are computed once here instead of once per detector.
+    """
+    def __init__(self, frame):
+        self.frame = frame
+        #Converting 3-channel images to 1-channel image
+        self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.faces = []
+        self.landmarks = []
 
-    for face in faces:
+    @property
+    def faceCount(self):
+        return len(self.faces)
+
+
+def faceLandmarks(image, faces):
+    #Returns the 68 facial landmarks of every face as a list of numpy arrays of (x,y) coordinates
+    return [face_utils.shape_to_np(model_registry.shapePredictor()(image, face)) for face in faces]
+
+
+def analyseFrame(frame, faceTracker=None):
+    """
+    Input: It will receive a video frame, from the front camera, and optionally a face_tracking.FaceTracker
+    Output: Returns a FrameContext holding the gray image, the detected faces and their landmarks
+    """
+    context = FrameContext(frame)
+
+    #With a tracker the full face detection only runs every few frames
+    if faceTracker is not None:
+        context.faces = faceTracker.update(context.gray)
+    else:
+        context.faces = detectFaceRects(context.gray)
+
+    #Determine the facial landmarks for every face region, only once per frame
+    context.landmarks = faceLandmarks(context.gray, context.faces)
+
+    for face, facialLandmarks in zip(context.faces, context.landmarks):
 
         x,y,w,h = face.left(), face.top(), face.width(), face.height()
 
@@ -51,15 +131,18 @@ def detectFace(frame):
 
         # cv2.rectangle(frame, (x,y), (x+w, y+h), (255,0,0), 2)
 
-        #Determine the facial landmarks for the face region
-        facialLandmarks = shapePredictor(gray, face)
-
-        #Convert the facial landmark (x,y) coordinates to a numpy array
-        facialLandmarks = face_utils.shape_to_np(facialLandmarks)
-
         for (a,b) in facialLandmarks:
             #Draw the circle on the face
-            cv2.circle(frame, (a, b),2,(255,255,0),-1)
+            cv2.circle(frame, (int(a), int(b)),2,(255,255,0),-1)
+
 
+    return context
 
-    return (faceCount, faces)
\ No newline at end of file
+
+def detectFace(frame):
+    """
+    Input: It will receive a video frame, from the front camera
+    Output: Returns the counts of faces (detect all the faces and localize them) detected by the dlib's face detector
+    """
+    context = analyseFrame(frame)
+    return (context.faceCount, context.faces)
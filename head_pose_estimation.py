@@ -1,7 +1,8 @@
 import numpy as np
-import dlib
 import math
 import cv2
+from imutils import face_utils
+import model_registry
 # from facial_detections import detectFace
 
 def get_2d_points(img, rotation_vector, translation_vector, camera_matrix, val):
@@ -94,26 +95,27 @@ camera_matrix = np.array(
     [0, 0, 1]], dtype = "double"
 )
 
-shapePredictorModel  = 'shape_predictor_model/shape_predictor_68_face_landmarks.dat'
-shapePredictor = dlib.shape_predictor(shapePredictorModel)
 
 # while True:
 #     ret, img = cap.read()
 #     if ret == True:
 #         faceCount, faces = detectFace(img)
     
-def head_pose_detection(faces, img):
+def head_pose_detection(faces, img, landmarks=None):
 
-    for face in faces:
-        marks = shapePredictor(img, face)
+    #landmarks computed once per frame by facial_detections.analyseFrame can be passed in
+    if landmarks is None:
+        landmarks = [face_utils.shape_to_np(model_registry.shapePredictor()(img, face)) for face in faces]
+
+    for marks in landmarks:
 
         image_points = np.array([
-            [marks.part(30).x, marks.part(30).y],    #Nose tip
-            [marks.part(8).x, marks.part(8).y],      #Chin
-            [marks.part(36).x, marks.part(36).y],    #Left eye left corner
-            [marks.part(45).x, marks.part(45).y],    #Right eye right corner
-            [marks.part(48).x, marks.part(48).y],    #Left Mouth corner
-            [marks.part(54).x, marks.part(54).y]     #Right mouth corner
+            marks[30],    #Nose tip
+            marks[8],     #Chin
+            marks[36],    #Left eye left corner
+            marks[45],    #Right eye right corner
+            marks[48],    #Left Mouth corner
+            marks[54]     #Right mouth corner
         ], dtype="double")
 
         dist_coeffs = np.zeros((4,1))
@@ -1,25 +1,28 @@
 import cv2
 # import imutils
-import time
-import winsound
-from facial_detections import detectFace
+from facial_detections import analyseFrame
+from face_tracking import FaceTracker
 from blink_detection import isBlinking
 from mouth_tracking import mouthTrack
-from object_detection import detectObject
+from object_detection import detectObject, suspiciousClasses
 from eye_tracker import gazeDetection
 from head_pose_estimation import head_pose_detection
+from alert_dispatcher import AlertDispatcher
+from video_capture import FrameGrabber, printLatency
+import time
+from activity_log import ActivityLog
 from datetime import datetime
 
 
-global data_record
-data_record = []
+#State changes are streamed to activity.jsonl instead of being kept in memory
+activityLog = ActivityLog()
 
 running = True
 
 
-#For Beeping
-frequency = 2500
-duration = 1000
+#Beeps are played by the alert dispatcher thread so the loop never stalls
+alerts = AlertDispatcher()
+alerts.start()
 
 #OpenCV videocapture for the webcam
 cam = cv2.VideoCapture(0)
@@ -31,13 +34,11 @@ if (cam.isOpened() == False):
 #Face Count If-else conditions
 def faceCount_detection(faceCount):
     if faceCount > 1:
-        time.sleep(5)
         remark = "Multiple faces has been detected."
-        winsound.Beep(frequency, duration)
+        alerts.alert('faceCount', remark)
     elif faceCount == 0:
         remark = "No face has been detected."
-        time.sleep(5)
-        winsound.Beep(frequency, duration)
+        alerts.alert('faceCount', remark)
     else:
         remark = "Face detecting properly."
     return remark
@@ -47,93 +48,108 @@ def faceCount_detection(faceCount):
 def proctoringAlgo():
 
     blinkCount = 0
+    faceTracker = FaceTracker()
 
-    while running:
-        ret, frame = cam.read()
-        # frame = imutils.resize(frame, width=450)
+    #The camera is released when the previous /video_feed stream ended
+    if not cam.isOpened():
+        cam.open(0)
 
-        record = []
+    #The capture thread keeps the newest frames, the loop always analyses the latest one
+    grabber = FrameGrabber(cam)
+    grabber.start()
+    frameId = 0
 
-        #Reading the current time
-        current_time = datetime.now().strftime("%H:%M:%S.%f")
-        print("Current time is:", current_time)
-        record.append(current_time)
+    try:
+        while running:
+            latest = grabber.latest(frameId)
+            if latest is None:
+                continue
+            frameId, captureTime, frame = latest
+            analysisStart = time.time()
+            # frame = imutils.resize(frame, width=450)
 
-        #Returns the face count and will detect the face.
-        faceCount, faces = detectFace(frame)
-        print(faceCount_detection(faceCount))
-        record.append(faceCount_detection(faceCount))
-        # print(faceCount)
+            record = {}
 
-        if faceCount == 1:
+            #Capture time of the frame
+            current_time = datetime.fromtimestamp(captureTime).strftime("%H:%M:%S.%f")
+            print("Current time is:", current_time)
 
-            #Blink Detection
-            blinkStatus = isBlinking(faces, frame)
-            print(blinkStatus[2])
+            #Detects the faces and computes their landmarks once, shared by every detector below
+            context = analyseFrame(frame, faceTracker)
+            faceCount, faces, landmarks = context.faceCount, context.faces, context.landmarks
+            remark = faceCount_detection(faceCount)
+            print(remark)
+            record['face'] = remark
+            # print(faceCount)
 
-            if blinkStatus[2] == "Blink":
-                blinkCount += 1
-                record.append(blinkStatus[2] + " count: " + str(blinkCount))
-            else:
-                record.append(blinkStatus[2])
+            if faceCount == 1:
 
+                #Blink Detection
+                blinkStatus = isBlinking(faces, frame, landmarks)
+                print(blinkStatus[2])
 
-            # Gaze Detection
-            eyeStatus = (gazeDetection(faces, frame))
-            print(eyeStatus)
-            record.append(eyeStatus)
+                if blinkStatus[2] == "Blink":
+                    blinkCount += 1
+                record['blink'] = blinkStatus[2]
+                record['blinkCount'] = blinkCount
 
-            # Mouth Position Detection
-            print(mouthTrack(faces, frame))
-            record.append(mouthTrack(faces, frame))
-            # mouthTrack(faces, frame)
 
-            # Object detection using YOLO
-            objectName = detectObject(frame)
-            print(objectName)
-            record.append(objectName)
+                # Gaze Detection
+                eyeStatus = gazeDetection(faces, frame, landmarks)
+                print(eyeStatus)
+                record['gaze'] = eyeStatus
 
-            if len(objectName) > 1:
-                time.sleep(4)
-                winsound.Beep(frequency, duration)
-                continue
+                # Mouth Position Detection
+                mouthStatus = mouthTrack(faces, frame, landmarks)
+                print(mouthStatus)
+                record['mouth'] = mouthStatus
+                # mouthTrack(faces, frame)
 
-            # Head Pose estimation
-            print(head_pose_detection(faces, frame))
-            record.append(head_pose_detection(faces, frame))
+                # Object detection using YOLO
+                objectName = detectObject(frame, suspiciousClasses)
+                print(objectName)
+                record['objects'] = sorted({label for label, confidence in objectName})
 
-        
-        else:
-            data_record.append(record)
-            continue
+                if len(objectName) > 1:
+                    alerts.alert('object', "Suspicious object has been detected.")
 
-        data_record.append(record)
+                # Head Pose estimation
+                headStatus = head_pose_detection(faces, frame, landmarks)
+                print(headStatus)
+                record['headPose'] = headStatus
 
+        
+            else:
+                printLatency(captureTime, analysisStart)
+                activityLog.record(datetime.fromtimestamp(captureTime).isoformat(), record)
+                continue
 
-        # eyeStatus = gazeDetection(faces, frame)
-        # print(eyeStatus)
-        # print(objectName) 
+            printLatency(captureTime, analysisStart)
+            activityLog.record(datetime.fromtimestamp(captureTime).isoformat(), record)
 
 
-        #Convert the frame to JPEG format
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-    
-        yield (b'--frame\r\n'
-           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            # eyeStatus = gazeDetection(faces, frame)
+            # print(eyeStatus)
+            # print(objectName) 
 
 
-    cam.release()
-    cv2.destroyAllWindows()
+            #Convert the frame to JPEG format
+            _, buffer = cv2.imencode('.jpg', frame)
+            frame = buffer.tobytes()
+    
+            yield (b'--frame\r\n'
+               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    finally:
+        #Also runs when the client disconnects (GeneratorExit at the yield) or a detector raises,
+        #so the capture thread never outlives the loop
+        grabber.stop()
+        grabber.join()
+        cam.release()
+        cv2.destroyAllWindows()
 
 
 
 def main_app():
 
-    # print(data_record)
-    # Convert the list to a string with each element on a new line
-    activityVal = "\n".join(map(str, data_record))
-    # print(activityVal)
-
-    with open('activity.txt', 'w') as file:
-        file.write(str(activityVal))
+    # Write the buffered state changes to activity.jsonl and close the log
+    activityLog.close()
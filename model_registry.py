@@ -0,0 +1,124 @@
+# Process-wide registry of the ML models used by the detectors.
+# Every model is loaded lazily on first use and then shared by all the modules of the process.
+
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    #resource is not available on Windows, the resident size is then not reported
+    resource = None
+
+shapePredictorModel = 'shape_predictor_model/shape_predictor_68_face_landmarks.dat'
+
+yoloWeights = 'object_detection_model/weights/yolov3-tiny.weights'
+yoloConfig = 'object_detection_model/config/yolov3-tiny.cfg'
+yoloLabels = 'object_detection_model/objectLabels/coco.names'
+
+_loaders = {}
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def _residentSizeMB():
+    #Peak resident set size of the process (ru_maxrss is in KB on Linux and in bytes on macOS)
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if os.uname().sysname == 'Darwin':
+        return maxrss / (1024 * 1024)
+    return maxrss / 1024
+
+
+def register(name, loader):
+    #Registers a loader (a function without arguments returning the model) under the given name
+    with _lock:
+        _loaders[name] = loader
+
+
+def get(name):
+    """
+    Input: Name of a registered model
+    Output: Returns the model, loading it on the first call only (thread-safe)
+    """
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock:
+        #Another thread may have loaded the model while we were waiting for the lock
+        if name in _models:
+            return _models[name]
+
+        loader = _loaders[name]
+        rssBefore = _residentSizeMB()
+        start = time.perf_counter()
+        model = loader()
+        loadTime = time.perf_counter() - start
+        rssAfter = _residentSizeMB()
+
+        _models[name] = model
+        _stats[name] = {
+            'load_time': loadTime,
+            'resident_mb': None if rssBefore is None else rssAfter - rssBefore,
+        }
+
+    if rssBefore is None:
+        print(f"Model '{name}' loaded in {loadTime:.2f}s")
+    else:
+        print(f"Model '{name}' loaded in {loadTime:.2f}s, resident size +{rssAfter - rssBefore:.1f} MB")
+    return model
+
+
+def stats():
+    #Returns the load time and resident size of every model loaded so far
+    with _lock:
+        return {name: dict(values) for name, values in _stats.items()}
+
+
+def _loadShapePredictor():
+    import dlib
+    return dlib.shape_predictor(shapePredictorModel)
+
+
+def _loadFaceDetector():
+    import dlib
+    return dlib.get_frontal_face_detector()
+
+
+def _loadYolo():
+    import cv2
+
+    #net has the YOLO loaded
+    net = cv2.dnn.readNet(yoloWeights, yoloConfig)
+
+    with open(yoloLabels, "r") as file:
+        labelClasses = [name.strip() for name in file.readlines()]
+
+    #class name -> class id, so the detection loop never searches the label list
+    classIndexes = {name: index for index, name in enumerate(labelClasses)}
+
+    layerNames = net.getLayerNames()
+    outputLayers = [layerNames[layer - 1] for layer in net.getUnconnectedOutLayers()]
+    return net, outputLayers, labelClasses, classIndexes
+
+
+register('shape_predictor', _loadShapePredictor)
+register('face_detector', _loadFaceDetector)
+register('yolo', _loadYolo)
+
+
+def shapePredictor():
+    return get('shape_predictor')
+
+
+def faceDetector():
+    return get('face_detector')
+
+
+def yolo():
+    #Returns (net, output layer names, label classes, class name -> class id)
+    return get('yolo')
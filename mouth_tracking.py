@@ -1,9 +1,8 @@
-import dlib
 import cv2
 from math import hypot
+from imutils import face_utils
+import model_registry
 
-predictorModel = 'shape_predictor_model/shape_predictor_68_face_landmarks.dat'
-predictor = dlib.shape_predictor(predictorModel)
 
 def calcDistance(pointA, pointB):
 
@@ -12,19 +11,19 @@ def calcDistance(pointA, pointB):
     return dist
 
 
-def mouthTrack(faces, frame):
+def mouthTrack(faces, frame, landmarks=None):
 
-    for face in faces:
+    #landmarks computed once per frame by facial_detections.analyseFrame can be passed in
+    if landmarks is None:
+        landmarks = [face_utils.shape_to_np(model_registry.shapePredictor()(frame, face)) for face in faces]
 
-        facialLandmarks = predictor(frame, face)
+    for facialLandmarks in landmarks:
 
         #outer lip top point
-        outerTopX = facialLandmarks.part(51).x
-        outerTopY = facialLandmarks.part(51).y
+        outerTopX, outerTopY = facialLandmarks[51]
 
         #outer lip bottom point
-        outerBottomX = facialLandmarks.part(57).x
-        outerBottomY = facialLandmarks.part(57).y
+        outerBottomX, outerBottomY = facialLandmarks[57]
 
         dist = calcDistance((outerTopX, outerTopY), (outerBottomX, outerBottomY))
 
@@ -1,31 +1,25 @@
 import cv2
 import numpy as np
 import time
+import model_registry
 
-#net has the YOLO loaded
-net = cv2.dnn.readNet("object_detection_model/weights/yolov3-tiny.weights", "object_detection_model/config/yolov3-tiny.cfg")
-
-#classes that we have to detect using Object Detection Model
-label_classes = []
-
-with open("object_detection_model/objectLabels/coco.names","r") as file:
-    label_classes = [name.strip() for name in file.readlines()]
-
-layer_names = net.getLayerNames()
-# print(type(layer_names))
-# layer_names = [i for i in layer_names]
-# print(type(layer_names))
-output_layers = [layer_names[layer-1] for layer in net.getUnconnectedOutLayers()]
-
-colors = np.random.uniform(0,255,size=(len(label_classes),3))
+#net has the YOLO loaded lazily by the model registry on the first call of detectObject
+#classes that we have to detect using Object Detection Model are the registry's label classes
 
 font = cv2.FONT_HERSHEY_PLAIN
 start_time = time.time()
 frame_id = 0
 
-def detectObject(frame):
+#Classes that matter for proctoring, pass them to detectObject to ignore every other class
+suspiciousClasses = ['person', 'cell phone', 'book', 'laptop']
 
-    labels_this_frame = []
+def detectObject(frame, classes=None):
+    """
+    Input: video frame and optionally the names of the classes to report (e.g. suspiciousClasses)
+    Output: Returns the list of (label, confidence) of the objects detected in the frame
+    """
+
+    net, output_layers, label_classes, class_indexes = model_registry.yolo()
 
     height, width, channels = frame.shape
 
@@ -37,45 +31,31 @@ def detectObject(frame):
     #Output labels received at the output of model
     outs = net.forward(output_layers)
 
-    #show informations on the screen
-    class_ids = []
-    confidences = []
-    boxes = []
-
-    for out in outs:
-        for detection in out:
-            scores = detection[5:]
-            class_id = np.argmax(scores)
-            confidence = scores[class_id]
-
-            if confidence > 0.5:
+    #All the output rows in one array: (x, y, w, h, objectness, class scores...)
+    detections = np.concatenate([out.reshape(-1, out.shape[-1]) for out in outs])
 
-                #object detected
-                center_x = int(detection[0]*width)
-                center_y = int(detection[1]*height)
+    scores = detections[:, 5:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
 
-                w = int(detection[2]*width)
-                h = int(detection[3]*height)
+    mask = confidences > 0.5
+    if classes is not None:
+        wanted = [class_indexes[name] for name in classes]
+        mask &= np.isin(class_ids, wanted)
 
-                #rectangle co-ordinates
-                x = int(center_x - w/2)
-                y = int(center_y - h/2)
+    if not mask.any():
+        return []
 
-                boxes.append([x,y,w,h])
-                confidences.append(float(confidence))
-                class_ids.append(class_id)
+    detections, class_ids, confidences = detections[mask], class_ids[mask], confidences[mask]
 
-    indexes = cv2.dnn.NMSBoxes(boxes, confidences, 0.5, 0.4)
+    #rectangle co-ordinates, from the box center and size relative to the frame
+    sizes = detections[:, 2:4] * (width, height)
+    corners = detections[:, 0:2] * (width, height) - sizes / 2
+    boxes = np.hstack((corners, sizes)).astype(np.int32)
 
-    for i in range(len(boxes)):
-        if i in indexes:
-            #show the box only if it comes in non-max supression box
-            #x,y,w,h = boxes[i]
-            label = str(label_classes[class_ids[i]])
+    indexes = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(), 0.5, 0.4)
 
-            #color = colors[class_ids[i]]
-            labels_this_frame.append((label, confidences[i]))
-            # cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-	 		# cv2.putText(frame, label, (x, y + 30), font, 3, color, 3)
+    #keep only the boxes that come in non-max supression
+    labels_this_frame = [(str(label_classes[class_ids[i]]), float(confidences[i])) for i in np.array(indexes).reshape(-1)]
 
-    return labels_this_frame
\ No newline at end of file
+    return labels_this_frame
@@ -2,7 +2,7 @@ import { API_URL } from "./constants";
 
 const baseUrl = API_URL;
 
-async function request(method: string, endpoint: string, body?: any): Promise<any> {
+async function send(method: string, endpoint: string, body?: any): Promise<{ json: any, response: Response }> {
     const token = localStorage.getItem('token');
     const headers: Record<string, string> = {
         'Content-Type': 'application/json',
@@ -15,6 +15,11 @@ async function request(method: string, endpoint: string, body?: any): Promise<an
     });
     const json: { message: string } = await response.json();
     if (!response.ok) throw new Error(json.message || 'An error occurred');
+    return { json, response };
+}
+
+async function request(method: string, endpoint: string, body?: any): Promise<any> {
+    const { json } = await send(method, endpoint, body);
     return json;
 }
 
@@ -22,6 +27,13 @@ export function get(endpoint: string): Promise<any> {
     return request('GET', endpoint);
 }
 
+// One page of a keyset-paginated list, nextCursor is null on the last page
+export async function getPage(endpoint: string, cursor?: string | null): Promise<{ data: any[], nextCursor: string | null }> {
+    const url = cursor ? `${endpoint}${endpoint.includes('?') ? '&' : '?'}cursor=${encodeURIComponent(cursor)}` : endpoint;
+    const { json, response } = await send('GET', url);
+    return { data: json, nextCursor: response.headers.get('X-Next-Cursor') };
+}
+
 export function post(endpoint: string, body: any): Promise<any> {
     return request('POST', endpoint, body);
 }
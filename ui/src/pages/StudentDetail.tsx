@@ -1,7 +1,7 @@
 import { useEffect, useState, useRef, useCallback } from "react";
 import { Link, useParams } from "react-router-dom";
 import { Layout, Table, Typography, Button, Space, Spin, Row, Col, message } from "antd";
-import { get } from "../http";
+import { get, getPage } from "../http";
 import { io } from 'socket.io-client';
 import { use$ } from '@legendapp/state/react';
 import { observable } from '@legendapp/state';
@@ -41,6 +41,8 @@ const StudentDetail: React.FC = () => {
 	const { id } = useParams<{ id: string }>();
 	const [student, setStudent] = useState<Student | null>(null);
 	const [activities, setActivities] = useState<Activity[]>([]);
+	const [nextCursor, setNextCursor] = useState<string | null>(null);
+	const [loadingMore, setLoadingMore] = useState(false);
 	const [loading, setLoading] = useState(true);
 	const [showPlayButton, setShowPlayButton] = useState(false);
 	const [isPlaying, setIsPlaying] = useState(false);
@@ -257,18 +259,23 @@ const StudentDetail: React.FC = () => {
 			}
 		});
 
-		// Add socket event listener for suspicious activities
-		socketRef.current.on('suspicious_activity', (data: any) => {
-			console.log('Received suspicious activity:', data);
-			// Add the new activity to the activities list
-			setActivities(prev => [{
+		// Add socket event listener for suspicious activities, sent in batches
+		socketRef.current.on('suspicious_activities', (events: any[]) => {
+			console.log('Received suspicious activities:', events);
+			// Only the new activities of this student, closes just carry the end of an activity
+			const opened = events.filter(data => data.state === 'open' && String(data.studentId) === String(id));
+			if (opened.length === 0) {
+				return;
+			}
+			// Add the new activities to the activities list
+			setActivities(prev => [...opened.reverse().map(data => ({
 				id: data.id,
 				activity: data.activity,
 				timestamp: data.timestamp
-			}, ...prev]);
+			})), ...prev]);
 			
 			// Show notification
-			message.warning(`Suspicious activity detected: ${data.activity}`);
+			opened.forEach(data => message.warning(`Suspicious activity detected: ${data.activity}`));
 		});
 
 		return () => {
@@ -295,10 +302,11 @@ const StudentDetail: React.FC = () => {
 
 		const fetchActivities = async () => {
 			try {
-				const data = await get(
+				const { data, nextCursor } = await getPage(
 					`/students/${id}/suspicious-activities`
 				);
 				setActivities(data);
+				setNextCursor(nextCursor);
 			} catch (error) {
 				console.error("Error fetching activities:", error);
 			}
@@ -313,6 +321,23 @@ const StudentDetail: React.FC = () => {
 		fetchData();
 	}, [id]);
 
+	// The history is paginated, older activities are loaded on demand
+	const loadMoreActivities = async () => {
+		if (!nextCursor) {
+			return;
+		}
+		setLoadingMore(true);
+		try {
+			const page = await getPage(`/students/${id}/suspicious-activities`, nextCursor);
+			setActivities(prev => [...prev, ...page.data]);
+			setNextCursor(page.nextCursor);
+		} catch (error) {
+			console.error("Error fetching activities:", error);
+		} finally {
+			setLoadingMore(false);
+		}
+	};
+
 	// Show error messages
 	useEffect(() => {
 		if (errorMessage) {
@@ -422,6 +447,11 @@ const StudentDetail: React.FC = () => {
 						rowKey="id"
 						bordered
 					/>
+					{nextCursor && (
+						<Button onClick={loadMoreActivities} loading={loadingMore}>
+							Load older activities
+						</Button>
+					)}
 				</Space>
 			</Content>
 		</Layout>
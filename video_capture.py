@@ -0,0 +1,62 @@
+# Threaded capture stage for the proctoring loop.
+# A separate thread keeps reading the camera into a small ring buffer, so OpenCV's internal buffer never fills
+# with stale frames and the analysis always works on the newest frame whatever the speed of the detectors.
+
+import threading
+import time
+from collections import deque
+
+
+class FrameGrabber(threading.Thread):
+
+    def __init__(self, cam, bufferSize=2):
+        super().__init__(daemon=True)
+        self.cam = cam
+
+        #Ring buffer of (frameId, captureTime, frame), older frames are dropped automatically
+        self.frames = deque(maxlen=bufferSize)
+        self.newFrame = threading.Condition()
+        self.running = True
+        self.frameId = 0
+
+    def run(self):
+        while self.running:
+            ret, frame = self.cam.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+
+            with self.newFrame:
+                self.frameId += 1
+                self.frames.append((self.frameId, time.time(), frame))
+                self.newFrame.notify_all()
+
+    def latest(self, lastFrameId=0, timeout=1.0):
+        """
+        Input: Id of the last frame analysed
+        Output: Returns the newest (frameId, captureTime, frame), waiting for a frame newer than lastFrameId,
+        or None after the timeout
+        """
+        def hasNewFrame():
+            return not self.running or (self.frames and self.frames[-1][0] > lastFrameId)
+
+        with self.newFrame:
+            self.newFrame.wait_for(hasNewFrame, timeout)
+            if not self.frames or self.frames[-1][0] <= lastFrameId:
+                return None
+            return self.frames[-1]
+
+    def stop(self):
+        self.running = False
+        with self.newFrame:
+            self.newFrame.notify_all()
+
+
+def printLatency(captureTime, analysisStart):
+    #Per-stage latency of a frame: waiting after capture, analysis, and end-to-end capture-to-verdict
+    verdictTime = time.time()
+    print("Latency - capture to analysis: %.0f ms, analysis: %.0f ms, capture to verdict: %.0f ms" % (
+        (analysisStart - captureTime) * 1000,
+        (verdictTime - analysisStart) * 1000,
+        (verdictTime - captureTime) * 1000,
+    ))